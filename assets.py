@@ -0,0 +1,138 @@
+"""
+Downloads of the game assets (font and music).
+Every asset is listed in a manifest with its URL, size and SHA-256. Missing or damaged assets are downloaded
+in parallel over one pooled HTTP session, streamed in chunks into a .part file next to the target, verified
+and renamed into place atomically. A .part left by an interrupted download is continued with an HTTP Range
+request. Hashes of verified files are cached by size and modification time, so warm starts read no file.
+"""
+
+from collections import namedtuple
+import hashlib
+import json
+import os
+import threading
+
+Asset = namedtuple("Asset", "name url size sha256")
+
+
+class AssetError(Exception):
+    pass
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            sha256.update(chunk)
+    return sha256
+
+
+class AssetDownloader:
+    """Keeps the assets of the manifest in directory, the verification cache is a JSON file in it."""
+    chunk_size = 64 * 1024
+    timeout = 15  # seconds of waiting for the server, not for the whole download
+
+    def __init__(self, directory, manifest, cache_name="verified.json", workers=4):
+        self.directory = directory
+        self.manifest = manifest
+        self.cache_path = directory / cache_name
+        self.workers = workers
+        self.cache = {}  # name: [size, mtime_ns, sha256]
+        self.cache_lock = threading.Lock()
+        self.session = None
+
+    def path(self, asset):
+        return self.directory / asset.name
+
+    def load_cache(self):
+        try:
+            self.cache = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def save_cache(self):
+        tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        tmp.write_text(json.dumps(self.cache))
+        os.replace(tmp, self.cache_path)
+
+    def remember(self, asset):
+        stat = self.path(asset).stat()
+        with self.cache_lock:
+            self.cache[asset.name] = [stat.st_size, stat.st_mtime_ns, asset.sha256]
+
+    def is_verified(self, asset):
+        """Whether the file of the asset exists and matches the manifest, hashing it only if it changed since the last check."""
+        try:
+            stat = self.path(asset).stat()
+        except OSError:
+            return False
+        if stat.st_size != asset.size:
+            return False
+        if self.cache.get(asset.name) == [stat.st_size, stat.st_mtime_ns, asset.sha256]:
+            return True
+        if file_sha256(self.path(asset)).hexdigest() != asset.sha256:
+            return False
+        self.remember(asset)
+        return True
+
+    def missing(self):
+        """Assets that are missing or damaged."""
+        self.load_cache()
+        cache = dict(self.cache)
+        missing = [asset for asset in self.manifest if not self.is_verified(asset)]
+        if self.cache != cache:
+            self.save_cache()
+        return missing
+
+    def download_all(self, assets):
+        """Downloads the assets in parallel. Raises the first error, after all downloads have finished."""
+        if not assets:
+            return
+        # imported only when needed, requests with urllib3 take longer to import than the rest of the game
+        from concurrent.futures import ThreadPoolExecutor
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with requests.Session() as session:
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.session = session
+            try:
+                with ThreadPoolExecutor(min(self.workers, len(assets))) as executor:
+                    futures = [executor.submit(self.download, asset) for asset in assets]
+                for future in futures:
+                    future.result()
+            finally:
+                self.session = None
+                self.save_cache()
+
+    def download(self, asset):
+        path = self.path(asset)
+        part = path.with_name(path.name + ".part")
+        offset = part.stat().st_size if part.exists() else 0
+        if offset > asset.size:
+            offset = 0
+
+        sha256 = file_sha256(part) if offset else hashlib.sha256()
+        if offset < asset.size:
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            with self.session.get(asset.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                if offset and response.status_code != 206:  # server ignored the range, it sends the whole file
+                    offset = 0
+                    sha256 = hashlib.sha256()
+                with part.open("ab" if offset else "wb") as file:
+                    for chunk in response.iter_content(self.chunk_size):
+                        file.write(chunk)
+                        sha256.update(chunk)
+                    file.flush()
+                    os.fsync(file.fileno())
+
+        if sha256.hexdigest() != asset.sha256:
+            part.unlink()
+            if offset:  # the kept part may have been the damaged one, try once more from the start
+                return self.download(asset)
+            raise AssetError(f"{asset.name} does not match its checksum")
+        os.replace(part, path)
+        self.remember(asset)
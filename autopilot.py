@@ -0,0 +1,257 @@
+"""
+Bot playing Snake on a SnakeEngine, for the autopilot mode of the game and for tournaments (tournament.py).
+It plans a path to the apple with A* and follows it over the next moves, planning again only when the apple
+moves, the head leaves the path or a new banana lies on it, so most moves cost almost nothing even on huge boards.
+"""
+
+from collections import deque
+from heapq import heappop, heappush
+import weakref
+
+from engine import DIRECTIONS
+
+
+def neighbours(cell, cols, rows):
+    x, y = cell
+    for dx, dy in DIRECTIONS:
+        if 0 <= x + dx < cols and 0 <= y + dy < rows:
+            yield x + dx, y + dy
+
+
+class BodyAfter:
+    """
+    Cells of the snake after following a path and eating at its end, without copying the body: the cells of the path
+    and those of the body entered since the tick cutoff (see SnakeEngine.occupied).
+    """
+    def __init__(self, occupied, cutoff, path_cells):
+        self.occupied = occupied
+        self.cutoff = cutoff
+        self.path_cells = path_cells
+
+    def __contains__(self, cell):
+        tick = self.occupied.get(cell)
+        return tick is not None and tick >= self.cutoff or cell in self.path_cells
+
+
+class Autopilot:
+    """
+    Chooses the direction of every move of the engine's snake.
+    A path to the apple is taken only if the snake would still have room for its whole length after eating,
+    otherwise the snake follows its tail, or failing that, goes where it has the most room.
+    The path to the tail is kept like the one to the apple, while the head follows it and its next cell is free.
+    A move does at most max_work cells of work, expanded by searches or counted as room, so it costs a few milliseconds
+    at most on any board. A search that runs out of work gives up, counting room stops and a path is taken as unsafe.
+    After a failed search of the apple the next one waits retry moves, doubling up to max_retry, and so does the next
+    search of the tail after one that gave up. Without work left the snake goes on straight if it is safe.
+    """
+    max_work = 2_000
+    max_retry = 64
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.path = deque()  # cells to the apple, from the next one
+        self.path_cells = set()
+        self.target = None  # apple the path leads to
+        self.banana = None  # banana when the path was checked against it
+        self.expected_head = None
+        self.retry = 1
+        self.wait = 0  # moves until the next attempt to plan
+        self.plans = 0
+        self.work = 0  # cells left to expand or count in this move
+        self.gave_up = False  # the last search ran out of work
+        self.tail_path = deque()  # cells towards the tail, when there is no safe path to the apple
+        self.tail_retry = 1
+        self.tail_wait = 0
+
+    def direction(self):
+        """Direction for the next move, None if every move crashes."""
+        engine = self.engine
+        self.work = self.max_work
+        if not self.path_valid():
+            self.path.clear()
+            if self.wait:
+                self.wait -= 1
+            elif self.plan():
+                self.retry = 1
+                self.tail_path.clear()
+            else:
+                self.wait = self.retry
+                self.retry = min(2 * self.retry, self.max_retry)
+        if self.path:
+            cell = self.path.popleft()
+            self.path_cells.discard(cell)
+            self.expected_head = cell
+            return cell[0] - engine.head[0], cell[1] - engine.head[1]
+        return self.survive()
+
+    def path_valid(self):
+        engine = self.engine
+        if not self.path or self.target != engine.apple or self.expected_head != engine.head:
+            return False
+        if engine.banana != self.banana:
+            self.banana = engine.banana
+            if engine.banana in self.path_cells:
+                return False
+        return self.path[0] not in engine.occupied
+
+    def search(self, goal, blocked=()):
+        """
+        A* from the head to goal, avoiding the snake (except goal) and blocked cells.
+        Returns the path without the head, None if there is none or the search gave up.
+        """
+        engine = self.engine
+        cols, rows, occupied = engine.cols, engine.rows, engine.occupied
+        start = engine.head
+        gx, gy = goal
+        came_from = {start: None}
+        distance = {start: 0}
+        heap = [(0, 0, start)]
+        expansions = 0
+        self.gave_up = False
+        while heap:
+            _, _, cell = heappop(heap)
+            if cell == goal:
+                self.work -= expansions
+                path = deque()
+                while cell != start:
+                    path.appendleft(cell)
+                    cell = came_from[cell]
+                return path
+            expansions += 1
+            if expansions > self.work:
+                self.work = 0
+                self.gave_up = True
+                return None
+            steps = distance[cell] + 1
+            x, y = cell
+            for dx, dy in DIRECTIONS:
+                nx = x + dx
+                ny = y + dy
+                neighbour = (nx, ny)
+                if not (0 <= nx < cols and 0 <= ny < rows) or (neighbour in occupied or neighbour in blocked) and neighbour != goal:
+                    continue
+                if steps < distance.get(neighbour, steps + 1):
+                    distance[neighbour] = steps
+                    came_from[neighbour] = cell
+                    h = abs(nx - gx) + abs(ny - gy)
+                    heappush(heap, (steps + h, h, neighbour))  # ties go to the cell closer to the goal
+        self.work -= expansions
+        return None
+
+    def room(self, start, obstacles, enough, tail=None, seen=None):
+        """
+        Number of cells reachable from start, counting stops at enough or when the work of the move is used up.
+        Reaching tail counts as enough. The cells counted are added to seen, if given.
+        """
+        engine = self.engine
+        limit = min(enough, self.work)
+        seen = set() if seen is None else seen
+        seen.add(start)
+        queue = deque([start])
+        while queue and len(seen) < limit:
+            for neighbour in neighbours(queue.popleft(), engine.cols, engine.rows):
+                if neighbour == tail:
+                    self.work -= len(seen)
+                    return enough
+                if neighbour not in obstacles and neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        self.work -= len(seen)
+        return len(seen)
+
+    def plan(self):
+        """Looks for a safe path to the apple, returns whether there is one."""
+        engine = self.engine
+        self.plans += 1
+        self.target = engine.apple
+        self.banana = engine.banana
+        if engine.apple is None:
+            return False
+        path = self.search(engine.apple, () if engine.banana is None else (engine.banana,))
+        if path is None:
+            return False
+        # the snake after eating: the path followed by as much of the body as the length allows,
+        # it is safe if it can follow its tail from there or has room for twice its length
+        body = engine.body
+        length = len(body) + 1
+        path_cells = set(path)
+        left_behind = len(path) - 1  # cells of the tail, the last move eats
+        if left_behind < len(body):
+            obstacles = BodyAfter(engine.occupied, engine.occupied[body[0]] + left_behind, path_cells)
+            tail = body[left_behind]
+        else:
+            obstacles = list(path)[-length:]
+            tail = obstacles[0]
+            obstacles = set(obstacles)
+        enough = 2 * length
+        if self.room(path[-1], obstacles, enough, tail=tail if length > 2 else None) < enough:
+            return False
+        self.path = path
+        self.path_cells = path_cells
+        self.expected_head = engine.head
+        return True
+
+    def survive(self):
+        """
+        Direction following the tail, or with the most room, when there is no safe path to the apple.
+        The tail is searched only with work left in the move.
+        """
+        engine = self.engine
+        safe = engine.safe_directions()
+        if not safe:
+            return None
+        length = len(engine.body)
+        x, y = engine.head
+        if length > 1 and self.tail_path_valid():
+            cell = self.tail_path.popleft()
+            self.expected_head = cell
+            return cell[0] - x, cell[1] - y
+        self.tail_path.clear()
+        if length > 1 and self.tail_wait:
+            self.tail_wait -= 1
+        elif length > 1 and self.work > 0:
+            path = self.search(engine.body[0])
+            if path and len(path) > 1:  # not onto the tail itself, it only moves away when no apple is eaten
+                self.tail_retry = 1
+                path.pop()  # the tail cell, free again only if the tail moved away meanwhile
+                self.tail_path = path
+                cell = path.popleft()
+                self.expected_head = cell
+                return cell[0] - x, cell[1] - y
+            if self.gave_up:  # searches that failed within the work of a move are tried again on the next one
+                self.tail_wait = self.tail_retry
+                self.tail_retry = min(2 * self.tail_retry, self.max_retry)
+        # directions into a region already counted have as much room as the one that counted it
+        best, most, seen = None, -1, set()
+        for dx, dy in safe:
+            cell = (x + dx, y + dy)
+            if cell in seen:
+                continue
+            if self.work <= 0:
+                break
+            region = set()
+            count = self.room(cell, engine.occupied, length + 1, seen=region)
+            seen |= region
+            if count > most:
+                best, most = (dx, dy), count
+        if best is None:  # no work left
+            straight = (engine.dirx_current, engine.diry_current)
+            return straight if straight in safe else safe[0]
+        return best
+
+    def tail_path_valid(self):
+        engine = self.engine
+        if not self.tail_path or self.expected_head != engine.head:
+            return False
+        cell = self.tail_path[0]
+        return cell not in engine.occupied and cell != engine.banana
+
+
+pilots = weakref.WeakKeyDictionary()  # engine: Autopilot, for policy()
+
+
+def policy(engine, rng):
+    """Tournament policy (see tournament.py), one Autopilot for each game."""
+    if (pilot := pilots.get(engine)) is None:
+        pilot = pilots[engine] = Autopilot(engine)
+    return pilot.direction()
@@ -0,0 +1,228 @@
+"""
+Many games of Snake advanced in lockstep with NumPy, for bot training and balance testing.
+Follows the same rules as engine.SnakeEngine, including the order of random fruit spawns,
+so a game of the batch with a given seed plays out exactly like SnakeEngine(seed=seed).
+Requires NumPy, which the game itself does not need.
+"""
+
+import random
+import time
+
+import numpy as np
+
+from engine import DIRECTIONS, SnakeEngine
+
+DX = np.array([dx for dx, dy in DIRECTIONS], dtype=np.int32)
+DY = np.array([dy for dx, dy in DIRECTIONS], dtype=np.int32)
+NONE = -1  # no direction / no fruit
+
+
+class BatchEngine:
+    """
+    N boards of cols × rows cells. Cells are stored as indices y * cols + x.
+    The body of every game is a ring buffer of cells, from tail_ptr to head_ptr.
+    """
+    def __init__(self, n, cols, rows, seeds=None, banana_lifetime=100):
+        self.n = n
+        self.cols = cols
+        self.rows = rows
+        self.cells = cols * rows
+        self.banana_lifetime = banana_lifetime
+        self.seeds = list(range(n)) if seeds is None else list(seeds)
+        self.reset()
+
+    def reset(self):
+        n, cells = self.n, self.cells
+        games = np.arange(n)
+        self.games = games
+        self.randoms = [random.Random(seed) for seed in self.seeds]
+        self.dirx = np.zeros(n, dtype=np.int32)
+        self.diry = np.zeros(n, dtype=np.int32)
+        self.dirx_current = np.zeros(n, dtype=np.int32)
+        self.diry_current = np.zeros(n, dtype=np.int32)
+
+        self.occupied = np.zeros((n, cells), dtype=bool)
+        self.ring = np.zeros((n, cells), dtype=np.int32)
+        self.head_ptr = np.zeros(n, dtype=np.int32)
+        self.tail_ptr = np.zeros(n, dtype=np.int32)
+        self.length = np.ones(n, dtype=np.int32)
+        # free cells with swap-remove, same order as the permutation of SnakeEngine (SnakeEngine.order and SnakeEngine.position)
+        self.free = np.tile(np.arange(cells, dtype=np.int32), (n, 1))
+        self.free_index = self.free.copy()
+        self.free_count = np.full(n, cells, dtype=np.int32)
+
+        start = np.full(n, (self.rows - 1) // 2 * self.cols + (self.cols - 1) // 2, dtype=np.int32)
+        self.ring[:, 0] = start
+        self.occupied[games, start] = True
+        self.take_cells(games, start)
+
+        self.score = np.zeros(n, dtype=np.int32)
+        self.ticks = np.zeros(n, dtype=np.int32)
+        self.over = np.zeros(n, dtype=bool)
+        self.won = np.zeros(n, dtype=bool)
+        self.apple = np.full(n, NONE, dtype=np.int32)
+        self.banana = np.full(n, NONE, dtype=np.int32)
+        self.banana_lifetime_left = np.full(n, self.banana_lifetime, dtype=np.int32)
+        self.spawn(games, self.apple)
+        self.spawn(games, self.banana)
+
+    @property
+    def head(self):
+        return self.ring[self.games, self.head_ptr]
+
+    def safe_directions(self):
+        """(N, 4) mask of directions that do not crash into a wall or the snake on the next move."""
+        head = self.head[:, None]
+        x = head % self.cols + DX
+        y = head // self.cols + DY
+        inside = (x >= 0) & (x < self.cols) & (y >= 0) & (y < self.rows)
+        cells = np.where(inside, y * self.cols + x, 0)
+        return inside & ~np.take_along_axis(self.occupied, cells, axis=1)
+
+    def take_cells(self, games, cells):
+        i = self.free_index[games, cells]
+        self.free_count[games] -= 1
+        last = self.free[games, self.free_count[games]]
+        self.free[games, i] = last
+        self.free_index[games, last] = i
+        self.free_index[games, cells] = NONE
+
+    def release_cells(self, games, cells):
+        self.free_index[games, cells] = self.free_count[games]
+        self.free[games, self.free_count[games]] = cells
+        self.free_count[games] += 1
+
+    def spawn(self, games, fruit):
+        """Puts the fruit (self.apple or self.banana) on a random free cell in each of the given games."""
+        # Spawns are rare compared to moves, so every game draws from its own random.Random exactly like SnakeEngine
+        for g in games.tolist():
+            count = int(self.free_count[g])
+            if count == 0:
+                fruit[g] = NONE
+                continue
+            cell = self.free[g, self.randoms[g].randrange(count)]
+            fruit[g] = cell
+            self.take_cells(np.array([g]), np.array([cell]))
+
+    def pop_tails(self, games):
+        cells = self.ring[games, self.tail_ptr[games]]
+        self.occupied[games, cells] = False
+        self.release_cells(games, cells)
+        self.tail_ptr[games] = (self.tail_ptr[games] + 1) % self.cells
+        self.length[games] -= 1
+
+    def turn(self, directions):
+        """directions: index into engine.DIRECTIONS for every game, NONE to keep going."""
+        directions = np.asarray(directions)
+        given = directions != NONE
+        dx = np.where(given, DX[directions], 0)
+        dy = np.where(given, DY[directions], 0)
+        allowed = given & (((dx != 0) & (self.dirx_current == 0)) | ((dy != 0) & (self.diry_current == 0)))
+        self.dirx = np.where(allowed, dx, self.dirx)
+        self.diry = np.where(allowed, dy, self.diry)
+
+    def step(self, directions=None):
+        """Makes one move in every game that is not over. Returns the mask of games still running."""
+        if directions is not None:
+            self.turn(directions)
+        running = ~self.over
+        self.dirx_current = np.where(running, self.dirx, self.dirx_current)
+        self.diry_current = np.where(running, self.diry, self.diry_current)
+        active = running & ((self.dirx != 0) | (self.diry != 0))
+
+        aging = active & (self.ticks > 0)
+        self.banana_lifetime_left[aging] -= 1
+        expired = np.flatnonzero(aging & (self.banana_lifetime_left == 0))
+        if expired.size:
+            present = expired[self.banana[expired] != NONE]
+            self.release_cells(present, self.banana[present])
+            self.spawn(expired, self.banana)
+            self.banana_lifetime_left[expired] = self.banana_lifetime
+        self.ticks[active] += 1
+
+        games = np.flatnonzero(active)
+        head = self.ring[games, self.head_ptr[games]]
+        x = head % self.cols + self.dirx[games]
+        y = head // self.cols + self.diry[games]
+        inside = (x >= 0) & (x < self.cols) & (y >= 0) & (y < self.rows)
+        new_head = np.where(inside, y * self.cols + x, 0)
+        dead = ~inside | self.occupied[games, new_head]
+        self.over[games[dead]] = True
+        games, new_head = games[~dead], new_head[~dead]
+
+        self.head_ptr[games] = (self.head_ptr[games] + 1) % self.cells
+        self.ring[games, self.head_ptr[games]] = new_head
+        self.occupied[games, new_head] = True
+        self.length[games] += 1
+        was_free = self.free_index[games, new_head] != NONE
+        self.take_cells(games[was_free], new_head[was_free])
+
+        ate_apple = new_head == self.apple[games]
+        eaten = games[ate_apple]
+        self.score[eaten] += 1
+        self.spawn(eaten, self.apple)
+        full = eaten[self.apple[eaten] == NONE]
+        self.over[full] = True
+        self.won[full] = True
+        self.pop_tails(games[~ate_apple])
+
+        ate_banana = games[new_head == self.banana[games]]
+        self.score[ate_banana] -= 1
+        lost = self.score[ate_banana] < 0
+        self.score[ate_banana[lost]] = 0
+        self.over[ate_banana[lost]] = True
+        self.pop_tails(ate_banana[~lost])
+        self.spawn(ate_banana, self.banana)
+        self.banana_lifetime_left[ate_banana] = self.banana_lifetime
+
+        return ~self.over
+
+
+def random_safe_directions(batch, rng, crash_chance=0.002):
+    """Random direction for every game, avoiding crashes most of the time, so that games last long enough to eat."""
+    safe = batch.safe_directions() | (rng.random((batch.n, 4)) < crash_chance)
+    weights = safe * rng.random((batch.n, 4))
+    return np.where(safe.any(axis=1), weights.argmax(axis=1), NONE)
+
+
+def cross_check(n=200, cols=12, rows=9, banana_lifetime=15, max_moves=5000, seed=0):
+    """Plays the same seeded games on BatchEngine and SnakeEngine and compares them after every move."""
+    rng = np.random.default_rng(seed)
+    batch = BatchEngine(n, cols, rows, seeds=range(n), banana_lifetime=banana_lifetime)
+    engines = [SnakeEngine(cols, rows, seed=s, banana_lifetime=banana_lifetime) for s in range(n)]
+    for move in range(max_moves):
+        directions = random_safe_directions(batch, rng)
+        batch.step(directions)
+        for g, engine in enumerate(engines):
+            engine.step(None if directions[g] == NONE else DIRECTIONS[directions[g]])
+            hx, hy = engine.head
+            expected = (engine.over, engine.won, engine.score, hy * cols + hx, len(engine.body),
+                        NONE if engine.apple is None else engine.apple[1] * cols + engine.apple[0],
+                        NONE if engine.banana is None else engine.banana[1] * cols + engine.banana[0])
+            if engine.over and not engine.won:
+                expected = expected[:3]  # position after a crash is not meaningful
+            got = (bool(batch.over[g]), bool(batch.won[g]), int(batch.score[g]), int(batch.head[g]), int(batch.length[g]),
+                   int(batch.apple[g]), int(batch.banana[g]))[:len(expected)]
+            if got != expected:
+                raise AssertionError(f"game {g} diverged at move {move}: batch {got}, scalar {expected}")
+        if batch.over.all():
+            break
+    return move + 1, int(batch.score.max())
+
+
+def benchmark(n=4096, cols=31, rows=23, moves=500):
+    """Returns moves per second, counting only games that were still running."""
+    rng = np.random.default_rng(0)
+    batch = BatchEngine(n, cols, rows)
+    total = 0
+    start = time.perf_counter()
+    for _ in range(moves):
+        total += int((~batch.over).sum())
+        batch.step(random_safe_directions(batch, rng))
+    return total / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    moves, best = cross_check()
+    print(f"Cross-check against SnakeEngine passed ({moves} moves, best score {best})")
+    print(f"{benchmark():,.0f} game moves per second")
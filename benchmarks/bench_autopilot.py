@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Measures the time the autopilot takes to choose every move, on boards up to 500 × 500 cells.
+The moves are timed with FrameProfiler like frames of the game, one frame per move with the phases "plan" and "move".
+Games from the start do not grow the snake long on big boards, so a game on the biggest board also starts with a long
+snake coiled in a spiral, the apple in its middle: the path to the apple winds through the whole spiral and the snake
+mostly has to get by without a safe one, which is the slowest case of the autopilot.
+Run from the repository root: python3 benchmarks/bench_autopilot.py [--moves N] [--spiral SIDE] [--hgrm DIR]
+"""
+
+import argparse
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from autopilot import Autopilot  # noqa: E402
+from engine import SnakeEngine, LEFT  # noqa: E402
+from profiler import FrameProfiler  # noqa: E402
+
+
+def spiral(side, x0, y0):
+    """Cells of a square spiral with corridors of one cell between its turns, from the outer corner (x0, y0) inwards."""
+    lengths = [side - 1]
+    n = side - 1
+    while n > 0:
+        lengths += [n, n]
+        n -= 2
+    cells = [(x0, y0)]
+    x, y = x0, y0
+    for i, n in enumerate(lengths):
+        dx, dy = ((1, 0), (0, 1), (-1, 0), (0, -1))[i % 4]
+        for _ in range(n):
+            x += dx
+            y += dy
+            cells.append((x, y))
+    return cells
+
+
+def coiled(engine, side):
+    """Puts a snake coiled in a spiral of side cells on the board, the head at its outer corner, and the apple in its middle."""
+    engine.release_cell(engine.head)
+    engine.release_cell(engine.apple)
+    engine.release_cell(engine.banana)
+    x0 = y0 = (engine.cols - side) // 2
+    engine.body.clear()
+    engine.body.extend(reversed(spiral(side, x0, y0)))
+    # entered on the moves before the first one, ticks stays the number of moves of the benchmark
+    engine.occupied = {cell: i + 1 - len(engine.body) for i, cell in enumerate(engine.body)}
+    for cell in engine.body:
+        engine.take_cell(cell)
+    engine.score = len(engine.body) - 1  # so a banana does not end the game
+    engine.dirx, engine.diry = engine.dirx_current, engine.diry_current = LEFT
+    center = x0 + side // 2, y0 + side // 2
+    engine.apple = min((cell for cell in engine.free_cells() if abs(cell[0] - center[0]) + abs(cell[1] - center[1]) < 4),
+                       key=lambda cell: abs(cell[0] - center[0]) + abs(cell[1] - center[1]))
+    engine.take_cell(engine.apple)
+    engine.spawn_banana()
+
+
+def play(profiler, size, moves, seed=0, side=None):
+    """
+    Plays up to moves moves of one game on a size × size board, starting with a snake coiled in a spiral of side cells
+    if side is given. Returns the engine and its autopilot.
+    """
+    engine = SnakeEngine(size, size, seed=seed, banana_lifetime=100)
+    scene = f"{size}x{size}"
+    if side:
+        coiled(engine, side)
+        scene += f"/{len(engine.body)}"
+    pilot = Autopilot(engine)
+    for _ in range(moves):
+        profiler.start_frame(scene)
+        direction = pilot.direction()
+        profiler.mark("plan")
+        alive = engine.step(direction)
+        profiler.mark("move")
+        if not alive:
+            break
+    profiler.end_scene()
+    return scene, engine, pilot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--moves", type=int, default=20_000, help="at most, per board")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[31, 100, 500])
+    parser.add_argument("--spiral", type=int, default=141, help="side of the spiral of the long snake on the biggest board, 0 for none")
+    parser.add_argument("--hgrm", type=Path, help="write histograms of the phases to this directory")
+    args = parser.parse_args()
+
+    profiler = FrameProfiler(size=args.moves)
+    profiler.enable()
+    games = [(size, None) for size in args.sizes]
+    if args.spiral:
+        games.append((max(args.sizes), args.spiral))
+    print(f"{'board':>15}  {'moves':>6}  {'score':>5}  {'plans':>5}  {'plan p50 µs':>11}  {'p99 µs':>8}  {'max ms':>7}  {'end':>12}")
+    for size, side in games:
+        scene, engine, pilot = play(profiler, size, args.moves, side=side)
+        plan = next(row for row in profiler.summary(scene) if row[0] == "plan")
+        slowest = profiler.histograms[(scene, "plan")].max / 1000
+        print(f"{scene:>15}  {engine.ticks:>6}  {engine.score:>5}  {pilot.plans:>5}  {plan[1] * 1e6:>11.1f}  {plan[3] * 1e6:>8.1f}  {slowest:>7.2f}  {engine.cause or 'moves limit':>12}")
+    if args.hgrm:
+        print(f"{profiler.dump(args.hgrm)} histograms written to {args.hgrm}")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Compares drawing the snake with pygame.draw.rect per segment against blitting pre-rendered tiles with Surface.blits.
+Run from the repository root: python3 benchmarks/bench_draw.py
+"""
+
+from collections import deque
+import os
+from pathlib import Path
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import pygame  # noqa: E402
+
+import snake  # noqa: E402
+from snake import conf  # noqa: E402
+
+
+def serpentine(length, cols):
+    cells = deque()
+    for i in range(length):
+        row, col = divmod(i, cols)
+        cells.append((col if row % 2 == 0 else cols - 1 - col, row))
+    return cells
+
+
+def draw_rects():
+    for cell, color in snake.Snake.tiles():
+        pygame.draw.rect(snake.window, color, (*snake.cell_position(cell), conf.tile_width, conf.tile_width), border_radius=conf.tile_radius)
+
+
+def measure(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    pygame.display.init()
+    cols = 200
+    snake.window = pygame.Surface((conf.game_x + cols * conf.grid, conf.game_y + cols * conf.grid))
+    snake.TileSprites = snake.TileSpritesClass()
+    snake.Banana = snake.BananaClass()
+    snake.Snake = snake.SnakeClass()
+    snake.Camera = snake.CameraClass()
+
+    print(f"{'length':>8}  {'draw.rect ms':>12}  {'blits ms':>9}  {'speedup':>7}")
+    for length in (10, 100, 1_000, 10_000, 40_000):
+        engine = snake.Snake.engine
+        engine.body = serpentine(length, cols)
+        engine.occupied = {cell: i for i, cell in enumerate(engine.body)}
+        engine.score = length - 1
+        snake.Snake.prerender()
+        repeat = max(3, 20_000 // length)
+        rects = measure(draw_rects, repeat)
+        blits = measure(snake.Snake.draw, repeat)
+        print(f"{length:>8}  {rects * 1e3:>12.3f}  {blits * 1e3:>9.3f}  {rects / blits:>6.1f}x")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Measures the cost of a single move of SnakeEngine depending on the length of the snake.
+Run from the repository root: python3 benchmarks/bench_engine.py
+"""
+
+from collections import deque
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from engine import SnakeEngine, RIGHT  # noqa: E402
+
+
+def straight_snake(length, moves):
+    """Engine with a straight snake of given length in the middle row, heading right with free space for the given number of moves."""
+    engine = SnakeEngine(length + moves + 1, 3, seed=0, banana_lifetime=10 ** 9)
+    engine.body = deque((x, 1) for x in range(length))
+    engine.occupied = {cell: cell[0] - length + 1 for cell in engine.body}  # head entered at tick 0
+    for cell in engine.body:
+        if engine.is_free(cell):
+            engine.take_cell(cell)
+    engine.apple = (0, 0)
+    engine.banana = (0, 2)
+    engine.turn(RIGHT)
+    return engine
+
+
+def bench_move(length, moves=20_000):
+    engine = straight_snake(length, moves)
+    start = time.perf_counter()
+    for _ in range(moves):
+        engine.step()
+    elapsed = time.perf_counter() - start
+    assert not engine.over and len(engine.body) == length
+    return elapsed / moves
+
+
+if __name__ == "__main__":
+    print(f"{'length':>10}  {'µs / move':>10}")
+    for length in (10, 1_000, 10_000, 100_000):
+        print(f"{length:>10}  {bench_move(length) * 1e6:>10.3f}")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Compares polling pressed keys once per frame, as the game did before, with queuing turns from key presses (TurnQueue).
+Simulates quick double taps between moves, like up then left while moving right, at the frame rate and speed
+of the game, and reports how many of them made both turns and the latency from a key press to its move.
+Run from the repository root: python3 benchmarks/bench_input.py [--taps N] [--speed S]
+"""
+
+import argparse
+from pathlib import Path
+import random
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from engine import SnakeEngine, TurnQueue, LEFT, RIGHT, UP, DOWN  # noqa: E402
+from profiler import percentile  # noqa: E402
+
+FPS = 120
+HOLD = 6  # frames a key is held in a tap, 50 ms
+PRIORITY = (LEFT, RIGHT, UP, DOWN)  # order of the checks of the old polling code
+
+
+def double_tap(rng, speed, queued):
+    """Plays one double tap, returns whether both turns were made in order and the latency of each in frames (None if lost)."""
+    frames_per_move = FPS // speed
+    engine = SnakeEngine(101, 101, seed=0, banana_lifetime=10 ** 9)
+    turn_queue = TurnQueue()
+    first, second = rng.choice(((UP, LEFT), (DOWN, LEFT), (UP, RIGHT), (DOWN, RIGHT)))
+    engine.turn(RIGHT if second == LEFT else LEFT)  # the second turn is back to a side
+    start = 3 * frames_per_move + rng.randrange(frames_per_move)
+    taps = ((first, start), (second, start + rng.randrange(1, frames_per_move)))
+    moves = []  # (frame, direction)
+    for frame in range(taps[1][1] + 3 * frames_per_move):
+        held = {direction for direction, pressed in taps if pressed <= frame < pressed + HOLD}
+        if queued:
+            for direction, pressed in taps:
+                if frame == pressed:
+                    turn_queue.push(engine, direction, frame)
+        else:
+            for direction in PRIORITY:
+                if direction in held:
+                    engine.turn(direction)
+                    break
+        if frame % frames_per_move == 0:
+            if queued:
+                turn_queue.apply(engine)
+            engine.step()
+            moves.append((frame, (engine.dirx, engine.diry)))
+
+    latencies = []
+    after = 0
+    for direction, pressed in taps:
+        made = next((i for i, (frame, moved) in enumerate(moves) if i >= after and frame >= pressed and moved == direction), None)
+        latencies.append(None if made is None else moves[made][0] - pressed)
+        if made is not None:
+            after = made + 1
+    return None not in latencies, latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--taps", type=int, default=10_000)
+    parser.add_argument("--speed", type=int, default=10, help="moves per second")
+    args = parser.parse_args()
+
+    print(f"{'input':>8}  {'both turns':>10}  {'turns lost':>10}  {'p50 ms':>7}  {'p95 ms':>7}  {'max ms':>7}")
+    for name, queued in (("polling", False), ("queue", True)):
+        rng = random.Random(0)
+        results = [double_tap(rng, args.speed, queued) for _ in range(args.taps)]
+        latencies = sorted(latency * 1000 / FPS for complete, pair in results for latency in pair if latency is not None)
+        lost = sum(latency is None for complete, pair in results for latency in pair)
+        complete = sum(complete for complete, pair in results)
+        print(f"{name:>8}  {complete / args.taps:>10.1%}  {lost / (2 * args.taps):>10.1%}  "
+              f"{percentile(latencies, 50):>7.1f}  {percentile(latencies, 95):>7.1f}  {latencies[-1]:>7.1f}")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Load test of server.py: plays growing numbers of concurrent sessions and reports the moves (ticks) received per second
+and the jitter of ticks, the difference between the interval of two ticks of a session and 1 / its speed.
+Sessions use the speeds of the game in turn and steer their snake around the board, starting a new game after
+the end of one. Client and server share the machine, so on few cores the jitter includes the load of the client.
+Run from the repository root: python3 benchmarks/bench_server.py [--sessions 100 1000 …] [--seconds S] [--port P]
+Without --port a server is started for the test.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from engine import SPEEDS  # noqa: E402
+from profiler import percentile  # noqa: E402
+
+
+class Client:
+    """One session, going round the board one cell from its edges."""
+    def __init__(self, speed):
+        self.speed = speed
+        self.ticks = 0
+        self.jitter = []  # seconds
+        self.last = None
+        self.cols = self.rows = 0
+        self.direction = b"R"
+
+    def steer(self, x, y):
+        """Turn for the head at (x, y), None to go on."""
+        turns = {b"R": (x >= self.cols - 2, b"U"), b"U": (y <= 1, b"L"), b"L": (x <= 1, b"D"), b"D": (y >= self.rows - 2, b"R")}
+        corner, turn = turns[self.direction]
+        if corner:
+            self.direction = turn
+            return turn
+
+    async def run(self, host, port, until):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(b"START %d\n" % self.speed)
+        try:
+            while time.perf_counter() < until:
+                line = await asyncio.wait_for(reader.readline(), max(until - time.perf_counter(), 0.001))
+                words = line.split()
+                if not words:
+                    break
+                if words[0] == b"T":
+                    now = time.perf_counter()
+                    if self.last is not None:
+                        self.jitter.append(abs(now - self.last - 1 / self.speed))
+                    self.last = now
+                    self.ticks += 1
+                    if turn := self.steer(int(words[2]), int(words[3])):
+                        writer.write(turn + b"\n")
+                elif words[0] == b"GAME":
+                    self.cols, self.rows = int(words[1]), int(words[2])
+                    self.direction = b"R"
+                    self.last = None
+                    writer.write(b"R\n")
+                elif words[0] == b"OVER":
+                    writer.write(b"START %d\n" % self.speed)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            writer.close()
+
+
+async def load(host, port, sessions, seconds):
+    """Returns received ticks per second, expected ticks per second and the jitter of all ticks in seconds."""
+    clients = [Client(SPEEDS[i % len(SPEEDS)]) for i in range(sessions)]
+    start = time.perf_counter()
+    await asyncio.gather(*(client.run(host, port, start + seconds) for client in clients))
+    elapsed = time.perf_counter() - start
+    return sum(client.ticks for client in clients) / elapsed, sum(client.speed for client in clients), sorted(j for client in clients for j in client.jitter)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100, 500, 1000, 2000])
+    parser.add_argument("--seconds", type=float, default=10, help="of every load")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="of a running server")
+    args = parser.parse_args()
+
+    server = None
+    port = args.port
+    if port is None:
+        port = free_port()
+        server = subprocess.Popen([sys.executable, str(ROOT / "server.py"), "--port", str(port)], stderr=subprocess.DEVNULL)
+        wait_for_server(port)
+    try:
+        print(f"{'sessions':>8}  {'ticks/s':>8}  {'expected':>8}  {'p50 jitter ms':>13}  {'p99 jitter ms':>13}")
+        for sessions in args.sessions:
+            rate, expected, jitter = asyncio.run(load(args.host, port, sessions, args.seconds))
+            print(f"{sessions:>8}  {rate:>8.0f}  {expected:>8}  {percentile(jitter, 50) * 1000:>13.2f}  {percentile(jitter, 99) * 1000:>13.2f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Measures the time from starting the process to the first frame of the menu.
+Cold starts use a new game directory (no data, history or verified assets) and no cached bytecode,
+warm starts reuse both. Assets are copied from the repository, nothing is downloaded.
+The game runs with SDL dummy drivers unless SDL_VIDEODRIVER is set.
+Run from the repository root: python3 benchmarks/bench_startup.py [--cold N] [--warm N]
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from profiler import percentile  # noqa: E402
+
+
+def start_game(home, pycache):
+    """Returns seconds from spawning the process to the first frame, and the timeline reported by the game."""
+    env = dict(os.environ, HOME=str(home), PYTHONPYCACHEPREFIX=str(pycache), SNAKE_STARTUP_BENCHMARK="1")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # warm starts need the bytecode written by earlier runs
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env.setdefault("SDL_AUDIODRIVER", "dummy")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, str(ROOT / "snake.py")], cwd=home, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    timeline = None
+    for line in process.stdout:
+        if line.startswith("startup-timeline "):
+            elapsed = time.perf_counter() - start
+            timeline = json.loads(line.split(" ", 1)[1])
+            break
+    process.stdout.close()
+    if process.wait(timeout=30) or timeline is None:
+        raise RuntimeError("the game did not report its startup timeline")
+    return elapsed, timeline
+
+
+def new_home(parent):
+    home = Path(tempfile.mkdtemp(dir=parent))
+    assets = home / ".snake" / "assets"
+    assets.mkdir(parents=True)
+    for path in (ROOT / "assets").iterdir():
+        shutil.copy(path, assets)
+    return home
+
+
+def report(name, runs):
+    values = sorted(elapsed for elapsed, timeline in runs)
+    p50, p90, worst = percentile(values, 50), percentile(values, 90), values[-1]
+    print(f"{name:>5}  {len(runs):>4}  {p50 * 1000:>8.0f}  {p90 * 1000:>8.0f}  {worst * 1000:>8.0f}")
+
+
+def report_steps(name, runs):
+    steps = runs[0][1]["steps"]
+    medians = ", ".join(f"{step} {statistics.median(timeline['steps'][step] for elapsed, timeline in runs) * 1000:.1f}" for step in steps)
+    print(f"{name} median steps (ms, in the game): {medians}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cold", type=int, default=10)
+    parser.add_argument("--warm", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cold = [start_game(new_home(tmp), tempfile.mkdtemp(dir=tmp)) for _ in range(args.cold)]
+        home, pycache = new_home(tmp), tempfile.mkdtemp(dir=tmp)
+        start_game(home, pycache)
+        warm = [start_game(home, pycache) for _ in range(args.warm)]
+
+    print(f"{'start':>5}  {'runs':>4}  {'p50 ms':>8}  {'p90 ms':>8}  {'max ms':>8}")
+    report("cold", cold)
+    report("warm", warm)
+    report_steps("cold", cold)
+    report_steps("warm", warm)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite of the hot paths of the game, under the SDL dummy video driver and with seeded randomness.
+Results can be saved as JSON and compared with a saved baseline. The fastest round of every benchmark is compared,
+as it is the least disturbed by other processes, a slowdown over the threshold is a regression (exit status 1).
+Run from the repository root:
+    python3 benchmarks/suite.py --json results.json
+    python3 benchmarks/suite.py --baseline results.json [--threshold 0.1]
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import pygame  # noqa: E402
+
+import snake  # noqa: E402
+from snake import conf  # noqa: E402
+from bench_draw import serpentine  # noqa: E402
+from bench_engine import straight_snake  # noqa: E402
+from engine import SnakeEngine  # noqa: E402
+from profiler import FrameProfiler  # noqa: E402
+from replay import Replay  # noqa: E402
+from snapshot import Snapshot  # noqa: E402
+
+BENCHMARKS = {}  # name: function returning seconds per operation for each round
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+def timed(setup, operation, number, repeat):
+    """
+    Seconds per call of operation(state) in each of repeat rounds of number calls, setup() makes a new state for every round.
+    Garbage collection is off while timing, like in timeit.
+    """
+    results = []
+    for _ in range(repeat):
+        state = setup()
+        gc.disable()
+        start = time.perf_counter()
+        for _ in range(number):
+            operation(state)
+        results.append((time.perf_counter() - start) / number)
+        gc.enable()
+    return results
+
+
+def setup_game(tmp):
+    """Globals of snake.py, as set up by its main code, with the game data in tmp."""
+    pygame.display.init()
+    pygame.font.init()
+    snake.logger = logging.getLogger("benchmark")
+    snake.logger.setLevel(logging.CRITICAL)
+    conf.path_data = snake.MyPath(tmp) / "data"
+    conf.path_data_backup = snake.MyPath(tmp) / "data.backup"
+    conf.path_version_old = snake.MyPath(tmp) / "version"
+    conf.path_font = snake.MyPath(__file__).resolve().parent.parent / "assets" / "OpenSans-Bold.ttf"
+    snake.write_atomic(conf.path_data, snake.encode_save({"version": conf.version}))
+    snake.window = pygame.display.set_mode((conf.window_width, conf.window_height))
+    snake.TextCache = snake.TextCacheClass()
+    snake.TileSprites = snake.TileSpritesClass()
+    snake.Data = snake.File()
+    snake.Data.read()
+    snake.History = types.SimpleNamespace(highscore=lambda speed=None: 0, total_games=lambda: 0, total_time=lambda: 0)
+    snake.Profiler = FrameProfiler()
+    snake.ProfilerOverlay = snake.ProfilerOverlayClass()
+    snake.Apple = snake.AppleClass()
+    snake.Banana = snake.BananaClass()
+    snake.Snake = snake.SnakeClass()
+    snake.Snake.reinit()
+    snake.Camera = snake.CameraClass()
+    snake.TopBar = snake.TopBarClass()
+    snake.GameScreen = snake.GameScreenClass()
+    snake.CurrentSpeedText = snake.CurrentSpeedTextClass()
+    setup_menu(tmp)
+
+
+def setup_menu(tmp):
+    """Widgets of the menu, the mouse on the Play button."""
+    conf.path_save = snake.MyPath(tmp) / "save"
+    snake.SavedGame = snake.SavedGameClass()
+    snake.LastScore = snake.Text("last score: 42", conf.color_font, conf.font_size_lastscore)
+    snake.SnakeLogo = snake.Text("Snake Game", (255, 255, 255), 62)
+    snake.Author = snake.Text("Michał Machnikowski 2023", (215, 215, 215), 21)
+    snake.ButtonPlay = snake.Button((conf.window_width - conf.button_width) // 2, conf.ButtonPlay_y, conf.button_width, conf.button_height, "Play", conf.button_font_size)
+    snake.ButtonResume = snake.Button((conf.window_width - conf.grid) // 2 - conf.button_pair_width, conf.ButtonPlay_y, conf.button_pair_width, conf.button_height, "Resume", conf.button_pair_font_size)
+    snake.ButtonNewGame = snake.Button((conf.window_width + conf.grid) // 2, conf.ButtonPlay_y, conf.button_pair_width, conf.button_height, "New game", conf.button_pair_font_size)
+    snake.ButtonExit = snake.Button((conf.window_width - conf.button_width) // 2, conf.ButtonExit_y, conf.button_width, conf.button_height, "Exit", conf.button_font_size)
+    snake.WebsiteButton = snake.Button(conf.margin, conf.window_height - conf.margin - 2 * conf.grid, int(4.85 * conf.grid), 2 * conf.grid, "website", conf.font_size_website, radius=7)
+    snake.CreditsButton = snake.Button(conf.margin + int(5.5 * conf.grid), conf.window_height - conf.margin - 2 * conf.grid, int(4.65 * conf.grid), 2 * conf.grid, "credits", conf.font_size_website, radius=7)
+    snake.AutopilotButton = snake.ButtonAutopilot(conf.margin + int(10.8 * conf.grid), conf.window_height - conf.margin - 2 * conf.grid, int(5.6 * conf.grid), 2 * conf.grid, "autopilot", conf.font_size_website, radius=7)
+    snake.MenuScreen = snake.MenuScreenClass()
+    snake.SpeedText = snake.Text("Speed:", conf.color_font, 22)
+    snake.SpeedButtons = snake.ButtonSpeedGroup()
+    snake.HighscoresInMenu = snake.HighscoresInMenuClass()
+    snake.TotalStatsInMenu = snake.TotalStatsInMenuClass()
+    snake.VolumeWidgetInMenu = snake.VolumeWidgetInMenuClass()
+    snake.mouse = (conf.window_width // 2, conf.ButtonPlay_y + conf.button_height // 2)
+
+
+def snake_move(length, number=2000):
+    def setup():
+        engine = straight_snake(length, number)
+        snake.Snake.engine = engine
+        snake.Snake.replay = Replay.for_engine(engine, conf.speed, 0)
+        return engine
+    return lambda repeat: timed(setup, lambda engine: snake.Snake.move(), number, repeat)
+
+
+def fruit_spawn(fill, number=20_000):
+    """Spawning a fruit (formerly AppleClass.move) on a board with the given part of cells taken."""
+    def setup():
+        engine = new_engine()
+        rng = random.Random(0)
+        for cell in rng.sample(list(engine.free_cells()), int(fill * (engine.cols * engine.rows)) - (engine.cols * engine.rows - engine.free_count)):
+            engine.take_cell(cell)
+        return engine
+
+    def spawn(engine):
+        engine.release_cell(engine.random_free_cell())
+    return lambda repeat: timed(setup, spawn, number, repeat)
+
+
+def new_engine():
+    """Engine on the board of the game, replacing the one of a previous benchmark."""
+    snake.Snake.engine = SnakeEngine(conf.game_width // conf.grid, conf.game_height // conf.grid, seed=0)
+    return snake.Snake.engine
+
+
+def with_body(length, cols):
+    engine = new_engine()
+    engine.body = serpentine(length, cols)
+    engine.occupied = {cell: i - length + 1 for i, cell in enumerate(engine.body)}  # head entered at tick 0
+    engine.score = length - 1
+    snake.Snake.prerender()
+
+
+def large_board(length, size=1000):
+    """Scrolling board of size × size cells with a snake of the given length, the camera on its head."""
+    engine = snake.Snake.engine = SnakeEngine(size, size, seed=0)
+    engine.body = serpentine(length, size)
+    engine.occupied = {cell: i - length + 1 for i, cell in enumerate(engine.body)}  # head entered at tick 0
+    engine.score = length - 1
+    snake.Camera.center(engine.head)
+
+
+def snake_draw(length, number=20):
+    cols = 200
+
+    def setup():
+        snake.window = pygame.Surface((conf.game_x + cols * conf.grid, conf.game_y + (length // cols + 1) * conf.grid))
+        with_body(length, cols)
+    return lambda repeat: timed(setup, lambda state: snake.Snake.draw(), number, repeat)
+
+
+def game_redraw(length, number=20):
+    """Whole game scene on the real window size, the board holds 31 × 23 cells."""
+    def setup():
+        snake.window = pygame.display.get_surface()
+        with_body(length, snake.Snake.engine.cols)
+    return lambda repeat: timed(setup, lambda state: snake.game_redraw(), number, repeat)
+
+
+def game_screen_redraw(length, number=200):
+    """Frame of the dirty rendering after a move: the new head, the previous one and the tail left are repainted."""
+    def setup():
+        snake.window = pygame.display.get_surface()
+        with_body(length, snake.Snake.engine.cols)
+        snake.GameScreen.draw_full()
+        return snake.Snake.engine
+
+    def redraw(engine):
+        engine.changed += (engine.head, engine.body[-2], engine.body[0])
+        snake.GameScreen.redraw()
+    return lambda repeat: timed(setup, redraw, number, repeat)
+
+
+def game_redraw_large(length, number=20):
+    """Game scene scrolled over a board of 1000 × 1000 cells, it should cost the same for any length of the snake."""
+    def setup():
+        snake.window = pygame.display.get_surface()
+        large_board(length)
+    return lambda repeat: timed(setup, lambda state: snake.game_redraw(), number, repeat)
+
+
+def game_in_progress(length, size=1000):
+    """Engine with a snake of the given length on a board of size × size cells, its cells taken from the free ones."""
+    engine = SnakeEngine(size, size, seed=0)
+    engine.release_cell(engine.head)
+    engine.body = serpentine(length, size)
+    engine.occupied = {cell: i + 1 for i, cell in enumerate(engine.body)}
+    for cell in engine.body:
+        if engine.is_free(cell):
+            engine.take_cell(cell)
+    engine.ticks = length
+    engine.dirx = engine.dirx_current = 1
+    return engine
+
+
+def snapshot_take(length, number=1000):
+    """Leaving a game with Escape, in the game loop: the engine is handed over to the snapshot, encoding happens behind."""
+    def setup():
+        snake.Snake.engine = game_in_progress(length)
+    return lambda repeat: timed(setup, lambda state: snake.Snake.take_snapshot(), number, repeat)
+
+
+def snapshot_encode(length, number=20):
+    def setup():
+        engine = game_in_progress(length)
+        return Snapshot(engine, conf.speed, Replay.for_engine(engine, conf.speed, 0))
+    return lambda repeat: timed(setup, lambda snapshot: snapshot.encode(), number, repeat)
+
+
+def snapshot_decode(length, number=20):
+    def setup():
+        engine = game_in_progress(length)
+        return Snapshot(engine, conf.speed, Replay.for_engine(engine, conf.speed, 0)).encode()
+    return lambda repeat: timed(setup, Snapshot.decode, number, repeat)
+
+
+for length in (10, 1_000, 10_000):
+    benchmark(f"snake_move[{length}]")(snake_move(length))
+for fill in (0.1, 0.9, 0.99):
+    benchmark(f"fruit_spawn[{fill:.0%}]")(fruit_spawn(fill))
+for length in (10, 1_000, 10_000):
+    benchmark(f"snake_draw[{length}]")(snake_draw(length))
+for length in (10, 300, 700):
+    benchmark(f"game_redraw[{length}]")(game_redraw(length))
+    benchmark(f"game_screen_redraw[{length}]")(game_screen_redraw(length))
+for length in (10, 1_000, 100_000):
+    benchmark(f"game_redraw[1000x1000/{length}]")(game_redraw_large(length))
+for length in (10, 10_000):
+    benchmark(f"snapshot_take[{length}]")(snapshot_take(length))
+for length in (10, 1_000, 10_000):
+    benchmark(f"snapshot_encode[1000x1000/{length}]")(snapshot_encode(length))
+    benchmark(f"snapshot_decode[1000x1000/{length}]")(snapshot_decode(length))
+
+
+@benchmark("topbar_draw[same]")
+def topbar_draw_same(repeat, number=500):
+    return timed(lambda: None, lambda state: snake.TopBar.draw(), number, repeat)
+
+
+@benchmark("topbar_draw[changing]")
+def topbar_draw_changing(repeat, number=500):
+    """New score for every call, so its Text is rendered and not taken from the cache."""
+    def setup():
+        snake.window = pygame.display.get_surface()
+        return new_engine()
+
+    def draw(engine):
+        engine.score += 1
+        snake.TopBar.draw()
+    return timed(setup, draw, number, repeat)
+
+
+@benchmark("menu_draw[cached]")
+def menu_draw_cached(repeat, number=200):
+    """A frame of the menu, between changes of what it shows: a blit of the composited menu and the pointed button."""
+    def setup():
+        snake.window = pygame.display.get_surface()
+    return timed(setup, lambda state: snake.MenuScreen.draw(), number, repeat)
+
+
+@benchmark("menu_draw[composite]")
+def menu_draw_composite(repeat, number=200):
+    """A frame of the menu after a change, composited again, which is what every frame of the menu used to draw."""
+    def setup():
+        snake.window = pygame.display.get_surface()
+
+    def draw(state):
+        snake.MenuScreen.invalidate()
+        snake.MenuScreen.draw()
+    return timed(setup, draw, number, repeat)
+
+
+@benchmark("file_write")
+def file_write(repeat, number=50):
+    """Marking the game data as changed, as the game does it (the write happens behind)."""
+    return timed(lambda: None, lambda state: snake.Data.write(), number, repeat)
+
+
+@benchmark("file_flush")
+def file_flush(repeat, number=50):
+    """Writing changed game data to disk, with the backup and fsync."""
+    def flush(state):
+        snake.Data.write()
+        snake.Data.flush()
+    return timed(lambda: None, flush, number, repeat)
+
+
+@benchmark("file_read")
+def file_read(repeat, number=200):
+    return timed(lambda: None, lambda state: snake.Data.read(), number, repeat)
+
+
+@benchmark("split_into_lines[10k words]")
+def split_into_lines(repeat, number=5):
+    rng = random.Random(0)
+    words = ["snake", "apple", "banana", "a", "extraordinarily", "\n", "of", "the", "highscore"]
+    text = " ".join(rng.choice(words) for _ in range(10_000))
+    return timed(lambda: None, lambda state: snake.LongText.split_into_lines(text, 40), number, repeat)
+
+
+def run(names, repeat):
+    results = {}
+    for name in names:
+        rounds = BENCHMARKS[name](repeat)
+        results[name] = {"median_us": statistics.median(rounds) * 1e6, "min_us": min(rounds) * 1e6, "repeat": repeat}
+        print(f"{name:<30} {results[name]['median_us']:>12.3f} µs  (min {results[name]['min_us']:.3f})")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints changes against the baseline, returns the names of regressions."""
+    regressions = []
+    print(f"\n{'benchmark':<30} {'baseline µs':>12} {'now µs':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, now = baseline[name]["min_us"], result["min_us"]
+        change = now / before - 1
+        verdict = ""
+        if change > threshold:
+            verdict = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            verdict = "faster"
+        print(f"{name:<30} {before:>12.3f} {now:>12.3f} {change:>+8.1%}  {verdict}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--json", type=Path, help="save results to this file")
+    parser.add_argument("--baseline", type=Path, help="compare with results saved by --json")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression (default 0.1)")
+    parser.add_argument("--filter", default="", help="run only benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=7, help="rounds of every benchmark, the fastest one is compared")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_game(tmp)
+        results = run([name for name in BENCHMARKS if args.filter in name], args.repeat)
+
+    if args.json:
+        meta = {"time": time.time(), "python": platform.python_version(), "pygame": pygame.version.ver, "machine": platform.machine(), "system": platform.system()}
+        args.json.write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text())["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,253 @@
+"""
+Game rules of Snake without any display or pygame dependency.
+Used by snake.py for the window game and usable on its own for bots, tests and replays.
+"""
+
+from collections import deque
+import random
+
+# Directions as (dx, dy) in cells
+LEFT = (-1, 0)
+RIGHT = (1, 0)
+UP = (0, -1)
+DOWN = (0, 1)
+DIRECTIONS = (LEFT, RIGHT, UP, DOWN)
+
+# Causes of the end of a game
+WALL = "wall"
+SELF = "self"
+BANANA = "banana"  # score dropped below zero
+BOARD_FULL = "board full"  # game won
+
+# Settings of the game, shared by the window game (snake.py), the server and the tournament
+SPEEDS = (5, 10, 15, 30, 60)  # moves per second to choose from
+COLS = 31  # board of the game, bigger ones are an option
+ROWS = 23
+BOARD_MAX = 65535  # cells in each direction, limit of replays and snapshots
+BANANA_SECONDS = 10  # lifetime of a banana
+
+
+class SnakeEngine:
+    """
+    Board of cols × rows cells, coordinates are (column, row) with (0, 0) in the top left corner.
+    One call to step() is one move of the snake.
+    """
+    def __init__(self, cols, rows, seed=None, banana_lifetime=100):
+        self.cols = cols
+        self.rows = rows
+        self.banana_lifetime = banana_lifetime  # in moves
+        self.random = random.Random(seed)
+        self.reset()
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.random.seed(seed)
+        self.dirx = 0
+        self.diry = 0
+        self.dirx_current = 0
+        self.diry_current = 0
+        self.body = deque([((self.cols - 1) // 2, (self.rows - 1) // 2)])  # from tail to head
+        self.ticks = 0  # number of moves made
+        # cells of body: tick when the head entered them, for O(1) collision checks and distance from the head
+        self.occupied = {self.head: self.ticks}
+        # Cells with neither snake nor fruit are the first free_count cells of a permutation of all cells, for O(1)
+        # random choice and swap-remove. Cells are numbered y * cols + x and the permutation starts as the identity,
+        # so only the entries of cells that were moved are stored and large boards cost nothing to set up.
+        self.free_count = self.cols * self.rows
+        self.order = {}  # position in the permutation: cell number
+        self.position = {}  # cell number: position in the permutation
+        self.take_cell(self.head)
+        self.score = 0
+        self.apples = 0  # eaten
+        self.bananas = 0  # eaten
+        self.over = False
+        self.won = False  # board filled up, there is no place for a new apple
+        self.cause = None  # why the game is over
+        # when a list, cells whose tile changed are appended to it by every move, for displays that redraw only them:
+        # the new head, the previous one, the tail cells left and the fruits spawned or removed (None for no banana)
+        self.changed = None
+        self.apple = self.random_free_cell()
+        self.spawn_banana()
+
+    @property
+    def head(self):
+        return self.body[-1]
+
+    @property
+    def moving(self):
+        return bool(self.dirx or self.diry)
+
+    def turn(self, direction):
+        """Changes direction, unless it would turn the snake back onto itself."""
+        dx, dy = direction
+        if dx and self.dirx_current == 0 or dy and self.diry_current == 0:
+            self.dirx = dx
+            self.diry = dy
+
+    def swap(self, number, i):
+        """Swaps the cell numbered number with the one at position i of the permutation."""
+        order = self.order
+        position = self.position
+        j = position.get(number, number)
+        other = order.get(i, i)
+        order[j] = other
+        position[other] = j
+        order[i] = number
+        position[number] = i
+
+    def is_free(self, cell):
+        number = cell[1] * self.cols + cell[0]
+        return self.position.get(number, number) < self.free_count
+
+    def free_cells(self):
+        """Free cells in the order of the permutation."""
+        for i in range(self.free_count):
+            number = self.order.get(i, i)
+            yield number % self.cols, number // self.cols
+
+    def safe_directions(self):
+        """Directions in which the next move would not crash, for bots."""
+        x, y = self.head
+        back = (-self.dirx_current, -self.diry_current)
+        return [(dx, dy) for dx, dy in DIRECTIONS if (dx, dy) != back and 0 <= x + dx < self.cols and 0 <= y + dy < self.rows
+                and (x + dx, y + dy) not in self.occupied]
+
+    def take_cell(self, cell):
+        self.free_count -= 1
+        self.swap(cell[1] * self.cols + cell[0], self.free_count)
+
+    def release_cell(self, cell):
+        self.swap(cell[1] * self.cols + cell[0], self.free_count)
+        self.free_count += 1
+
+    def pop_tail(self):
+        """Removes the tail segment, returns its cell."""
+        cell = self.body.popleft()
+        del self.occupied[cell]
+        self.release_cell(cell)
+        return cell
+
+    def random_free_cell(self):
+        """Takes a random free cell, returns None if there are none left."""
+        if not self.free_count:
+            return None
+        i = self.random.randrange(self.free_count)
+        number = self.order.get(i, i)
+        cell = (number % self.cols, number // self.cols)
+        self.take_cell(cell)
+        return cell
+
+    def spawn_banana(self):
+        self.banana = self.random_free_cell()
+        self.banana_lifetime_left = self.banana_lifetime
+
+    def step(self, direction=None):
+        """Makes one move, optionally turning first. Returns False once the game is over."""
+        if direction is not None:
+            self.turn(direction)
+        if self.over:
+            return False
+        self.dirx_current = self.dirx
+        self.diry_current = self.diry
+        if not self.moving:  # snake has not started yet
+            return True
+
+        changed = self.changed
+        if self.ticks:
+            self.banana_lifetime_left -= 1
+            if self.banana_lifetime_left == 0:
+                expired = self.banana
+                if expired is not None:
+                    self.release_cell(expired)
+                self.spawn_banana()
+                if changed is not None:
+                    changed += (expired, self.banana)
+        self.ticks += 1
+
+        x, y = self.head
+        head = (x + self.dirx, y + self.diry)
+        if not (0 <= head[0] < self.cols and 0 <= head[1] < self.rows):
+            self.over = True
+            self.cause = WALL
+            return False
+        if head in self.occupied:
+            self.over = True
+            self.cause = SELF
+            return False
+
+        if changed is not None:
+            changed += (head, (x, y))
+        self.body.append(head)
+        self.occupied[head] = self.ticks
+        if self.is_free(head):  # cells of fruits are not free, they were taken when spawning
+            self.take_cell(head)
+        if head == self.apple:  # ate the apple
+            self.score += 1
+            self.apples += 1
+            self.apple = self.random_free_cell()
+            if self.apple is None:
+                self.over = True
+                self.won = True
+                self.cause = BOARD_FULL
+            elif changed is not None:
+                changed.append(self.apple)
+        else:
+            tail = self.pop_tail()
+            if changed is not None:
+                changed.append(tail)
+
+        if head == self.banana:
+            self.score -= 1
+            self.bananas += 1
+            if self.score < 0:
+                self.score = 0
+                self.over = True
+                self.cause = BANANA
+            else:
+                tail = self.pop_tail()
+                if changed is not None:
+                    changed.append(tail)
+            self.spawn_banana()
+            if changed is not None:
+                changed.append(self.banana)
+
+        return not self.over
+
+
+class TurnQueue:
+    """
+    Turns requested between moves, one of them is made per move, so quick sequences like up then left are not lost.
+    A turn is dropped when requested if it would not change the direction or would reverse it, judged against
+    the last queued turn, or if depth turns are already waiting.
+    """
+    def __init__(self, depth=3):
+        self.depth = depth
+        self.turns = deque()  # (direction, time of the request)
+        self.queued = 0
+        self.dropped = 0
+
+    def clear(self):
+        self.turns.clear()
+        self.queued = 0
+        self.dropped = 0
+
+    def push(self, engine, direction, requested=None):
+        """Queues the turn, returns whether it was accepted. Before the first move the snake turns right away."""
+        if not engine.moving and not self.turns:
+            engine.turn(direction)
+            return True
+        last = self.turns[-1][0] if self.turns else (engine.dirx, engine.diry)
+        if direction == last or direction == (-last[0], -last[1]) or len(self.turns) >= self.depth:
+            self.dropped += 1
+            return False
+        self.turns.append((direction, requested))
+        self.queued += 1
+        return True
+
+    def apply(self, engine):
+        """Makes the next turn before a move, returns the time it was requested, None if there was none."""
+        if not self.turns or (engine.dirx, engine.diry) != (engine.dirx_current, engine.diry_current):
+            return None  # nothing queued or the first turn, made before the snake started, is still to be made
+        direction, requested = self.turns.popleft()
+        engine.turn(direction)
+        return requested
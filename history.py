@@ -0,0 +1,278 @@
+"""
+Append-only history of finished games.
+Every game is one fixed-size record in the history file. Aggregates per speed are kept in an index,
+which is updated and saved next to the history file with every appended record, so that statistics
+never need a scan of the whole history. After a crash only the records appended since the last save
+of the index, if any, are read again.
+"""
+
+from collections import Counter, namedtuple
+import json
+import os
+import struct
+import zlib
+
+from engine import WALL, SELF, BANANA, BOARD_FULL
+
+QUIT = "quit"  # player left the game
+CAUSES = (QUIT, WALL, SELF, BANANA, BOARD_FULL)  # stored as index
+
+RECORD = struct.Struct("<dHIdIIBx")  # 32 bytes
+GameRecord = namedtuple("GameRecord", "timestamp speed score duration apples bananas cause")
+
+
+def pack_record(record):
+    return RECORD.pack(record.timestamp, record.speed, record.score, record.duration, record.apples, record.bananas, CAUSES.index(record.cause))
+
+
+def unpack_records(content):
+    for timestamp, speed, score, duration, apples, bananas, cause in RECORD.iter_unpack(content):
+        yield GameRecord(timestamp, speed, score, duration, apples, bananas, CAUSES[cause])
+
+
+def first_checksum(content):
+    """CRC32 of the first record in content, None if there is none."""
+    return zlib.crc32(content[:RECORD.size]) if len(content) >= RECORD.size else None
+
+
+def write_synced(path, content):
+    with path.open("wb") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def median(counter):
+    """Median of values counted in a Counter, in O(number of distinct values)."""
+    total = sum(counter.values())
+    if not total:
+        return None
+    values = sorted(counter)
+    seen = 0
+    for i, value in enumerate(values):
+        seen += counter[value]
+        if seen * 2 > total:
+            return value
+        if seen * 2 == total:
+            return (value + values[i + 1]) / 2
+
+
+class SpeedStats:
+    """Aggregates of all games played at one speed."""
+    top_size = 100  # best games kept for top lists
+
+    def __init__(self):
+        self.games = 0
+        self.time = 0.0
+        self.scores = Counter()
+        self.durations = Counter()  # durations are multiples of the move interval, so they repeat a lot
+        self.top = []  # best records, sorted from the best
+
+    def add(self, record):
+        self.games += 1
+        self.time += record.duration
+        self.scores[record.score] += 1
+        self.durations[round(record.duration, 3)] += 1
+        self.add_top(record)
+
+    def add_many(self, values):
+        """Adds unpacked records (tuples of RECORD fields), in order."""
+        self.games += len(values)
+        self.time += sum(record[3] for record in values)
+        self.scores.update(record[2] for record in values)
+        self.durations.update(round(record[3], 3) for record in values)
+        # only records that can make it to the top are turned into GameRecords
+        limit = self.top[-1].score if len(self.top) >= self.top_size else -1
+        candidates = [record for record in values if record[2] > limit]
+        best = sorted(range(len(candidates)), key=lambda i: -candidates[i][2])[:self.top_size]
+        for i in sorted(best):
+            timestamp, speed, score, duration, apples, bananas, cause = candidates[i]
+            self.add_top(GameRecord(timestamp, speed, score, duration, apples, bananas, CAUSES[cause]))
+
+    def add_top(self, record):
+        if len(self.top) < self.top_size or record.score > self.top[-1].score:
+            i = len(self.top)
+            while i and self.top[i - 1].score < record.score:  # newer records go after older ones with the same score
+                i -= 1
+            self.top.insert(i, record)
+            del self.top[self.top_size:]
+
+    @property
+    def best(self):
+        return self.top[0].score if self.top else 0
+
+    def to_json(self):
+        return {
+            "games": self.games,
+            "time": self.time,
+            "scores": list(self.scores.items()),
+            "durations": list(self.durations.items()),
+            "top": [list(record) for record in self.top]
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        stats = cls()
+        stats.games = data["games"]
+        stats.time = data["time"]
+        stats.scores = Counter(dict(map(tuple, data["scores"])))
+        stats.durations = Counter(dict(map(tuple, data["durations"])))
+        stats.top = [GameRecord(*record) for record in data["top"]]
+        return stats
+
+
+class GameHistory:
+    """
+    History file with its index.
+    base holds totals from before the history existed (taken from the game data), so that statistics continue them.
+    Compaction drops the oldest records from the file, their games stay counted in the index. The compacted file is
+    written next to the history and the index is saved, with the checksum of its first record, before it replaces
+    the history, so open() can tell whether a compaction interrupted by a crash has to be finished or dropped.
+    """
+    def __init__(self, path, index_path, keep=100_000):
+        self.path = path
+        self.index_path = index_path
+        self.keep = keep  # records left in the file after compaction
+        self.speeds = {}
+        self.base = {"games": 0, "time": 0.0, "highscore": 0, "highscores_speed": {}}
+        self.indexed = 0  # number of records in the index, including compacted ones
+        self.compacted = 0  # number of records removed from the start of the file
+        self.first = None  # CRC32 of the first record left in the file by the last compaction
+        self.compacting_path = path.with_name(path.name + ".tmp")
+        self.file = None
+        self.new = False  # neither the history nor its index existed before
+
+    def open(self, base=None):
+        """base: totals from before the history existed, taken and saved right away if the history is new."""
+        self.new = not self.path.exists() and not self.index_path.exists()
+        try:
+            self.load_index()
+        except (OSError, ValueError, KeyError, TypeError):
+            self.speeds = {}
+            self.indexed = 0
+            self.compacted = 0
+            self.first = None
+        if self.compacting_path.exists():  # compaction interrupted
+            with self.compacting_path.open("rb") as file:
+                first = first_checksum(file.read(RECORD.size))
+            if first is not None and first == self.first:
+                os.replace(self.compacting_path, self.path)  # the index already counts it as done
+            else:
+                self.compacting_path.unlink()
+
+        size = self.path.stat().st_size if self.path.exists() else 0
+        if size % RECORD.size:  # last append was interrupted
+            with self.path.open("r+b") as file:
+                file.truncate(size - size % RECORD.size)
+            size -= size % RECORD.size
+        in_file = size // RECORD.size
+        start = self.indexed - self.compacted
+        if start > in_file:  # records counted in the index are missing from the file, their games stay counted
+            self.compacted = self.indexed - in_file
+            start = in_file
+        if start < in_file:
+            with self.path.open("rb") as file:
+                file.seek(start * RECORD.size)
+                self.add_many(file.read())
+
+        self.file = self.path.open("ab")
+        if self.new and base is not None:
+            self.base = base
+            self.save_index()  # nothing else keeps these totals up to date
+        if in_file > 2 * self.keep:
+            self.compact()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.save_index()
+
+    def add(self, record):
+        if record.speed not in self.speeds:
+            self.speeds[record.speed] = SpeedStats()
+        self.speeds[record.speed].add(record)
+        self.indexed += 1
+
+    def add_many(self, content):
+        """Same as add() for every packed record in content, but faster for long histories."""
+        by_speed = {}
+        for values in RECORD.iter_unpack(content):
+            by_speed.setdefault(values[1], []).append(values)
+        for speed, values in by_speed.items():
+            if speed not in self.speeds:
+                self.speeds[speed] = SpeedStats()
+            self.speeds[speed].add_many(values)
+            self.indexed += len(values)
+
+    def append(self, record):
+        self.file.write(pack_record(record))
+        self.file.flush()
+        self.add(record)
+        self.save_index()  # games end seconds apart at least, and a save takes a few milliseconds
+
+    def load_index(self):
+        data = json.loads(self.index_path.read_text())
+        self.base = data["base"]
+        self.indexed = data["indexed"]
+        self.compacted = data["compacted"]
+        self.first = data.get("first")
+        self.speeds = {int(speed): SpeedStats.from_json(stats) for speed, stats in data["speeds"].items()}
+
+    def save_index(self):
+        data = {
+            "base": self.base,
+            "indexed": self.indexed,
+            "compacted": self.compacted,
+            "first": self.first,
+            "speeds": {speed: stats.to_json() for speed, stats in self.speeds.items()}
+        }
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        write_synced(tmp, json.dumps(data, separators=(",", ":")).encode())
+        os.replace(tmp, self.index_path)
+
+    def compact(self):
+        """Keeps only the newest self.keep records in the file."""
+        self.file.close()
+        content = self.path.read_bytes()
+        drop = max(len(content) // RECORD.size - self.keep, 0)
+        content = content[drop * RECORD.size:]
+        write_synced(self.compacting_path, content)
+        self.compacted += drop
+        self.first = first_checksum(content)
+        self.save_index()
+        os.replace(self.compacting_path, self.path)
+        self.file = self.path.open("ab")
+
+    def records(self):
+        """All records still in the file, from the oldest. Scans the whole file, not used by statistics."""
+        self.file.flush()
+        return list(unpack_records(self.path.read_bytes()))
+
+    # Queries
+
+    def top(self, speed, n=10):
+        stats = self.speeds.get(speed)
+        return stats.top[:n] if stats else []
+
+    def highscore(self, speed=None):
+        if speed is None:
+            return max([self.highscore(speed) for speed in self.speeds] + [self.base.get("highscore", 0)])
+        best = self.speeds[speed].best if speed in self.speeds else 0
+        return max(best, self.base["highscores_speed"].get(str(speed), 0))
+
+    def total_games(self):
+        return self.base["games"] + sum(stats.games for stats in self.speeds.values())
+
+    def total_time(self):
+        return self.base["time"] + sum(stats.time for stats in self.speeds.values())
+
+    def median_duration(self, speed=None):
+        if speed is not None:
+            return median(self.speeds[speed].durations) if speed in self.speeds else None
+        return median(sum((stats.durations for stats in self.speeds.values()), Counter()))
+
+    def median_score(self, speed=None):
+        if speed is not None:
+            return median(self.speeds[speed].scores) if speed in self.speeds else None
+        return median(sum((stats.scores for stats in self.speeds.values()), Counter()))
@@ -0,0 +1,153 @@
+"""
+Timings of the phases of frames, for the profiling overlay and histograms of a session.
+A frame starts with FrameProfiler.start_frame() and every call of mark() ends one of its phases.
+While the profiler is disabled both return right away, so the instrumented loops keep their speed.
+"""
+
+from collections import Counter, deque
+import math
+import time
+
+FRAME = "frame"  # pseudo-phase: work of the whole frame, without idle phases
+
+
+class Histogram:
+    """
+    Log-linear histogram of durations in microseconds, like HdrHistogram: every power of two is split into
+    sub_buckets linear buckets, so values are kept with a relative error below 1 / sub_buckets.
+    """
+    sub_buckets = 32
+
+    def __init__(self):
+        self.counts = Counter()  # lower bound of bucket: count
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def bucket(cls, us):
+        n = int(us)
+        shift = max(n.bit_length() - cls.sub_buckets.bit_length(), 0)
+        return n >> shift << shift
+
+    @classmethod
+    def bucket_end(cls, bucket):
+        return bucket + (1 << max(bucket.bit_length() - cls.sub_buckets.bit_length(), 0))
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        self.counts[self.bucket(us)] += 1
+        self.count += 1
+        self.total += us
+        self.total_squares += us * us
+        if us > self.max:
+            self.max = us
+
+    def to_hgrm(self):
+        """Percentile distribution in the text format of HdrHistogram, values in milliseconds."""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            percentile = seen / self.count
+            inverse = f"{1 / (1 - percentile):14.2f}" if percentile < 1 else f"{'inf':>14}"
+            lines.append(f"{min(self.bucket_end(bucket), self.max) / 1000:12.3f} {percentile:14.12f} {seen:10d} {inverse}")
+        mean = self.total / self.count
+        deviation = math.sqrt(max(self.total_squares / self.count - mean * mean, 0))
+        lines.append(f"#[Mean    = {mean / 1000:12.3f}, StdDeviation   = {deviation / 1000:12.3f}]")
+        lines.append(f"#[Max     = {self.max / 1000:12.3f}, Total count    = {self.count:12d}]")
+        lines.append(f"#[Buckets = {len(self.counts):12d}, SubBuckets     = {self.sub_buckets:12d}]")
+        return "\n".join(lines) + "\n"
+
+
+def percentile(values, q):
+    """q-th percentile (0–100) of sorted values, nearest rank."""
+    return values[min(int(q / 100 * len(values)), len(values) - 1)]
+
+
+class FrameProfiler:
+    """
+    Durations of phases per scene: the last `size` frames in ring buffers for the overlay,
+    all frames since profiling was enabled in histograms for export.
+    A frame whose work took longer than its budget counts as dropped.
+    """
+    def __init__(self, size=600):
+        self.size = size
+        self.enabled = False
+        self.scene = None
+        self.budget = None
+        self.last = self.work = 0.0
+        self.recent = {}  # (scene, phase): deque of seconds
+        self.histograms = {}  # (scene, phase): Histogram
+        self.frames = Counter()  # scene: frames
+        self.dropped = Counter()  # scene: frames over budget
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        self.scene = None  # the frame in progress is not complete
+
+    def start_frame(self, scene, budget=None):
+        """Starts a frame of the scene, budget is the longest acceptable work of a frame in seconds."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.end_frame()
+        self.scene = scene
+        self.budget = budget
+        self.last = now
+        self.work = 0.0
+
+    def end_frame(self):
+        if self.scene is not None:
+            self.record(FRAME, self.work)
+            self.frames[self.scene] += 1
+            if self.budget and self.work > self.budget:
+                self.dropped[self.scene] += 1
+
+    def end_scene(self):
+        """Ends the frame in progress, phases marked until the next start_frame() are not recorded."""
+        if self.enabled:
+            self.end_frame()
+        self.scene = None
+
+    def mark(self, phase, idle=False):
+        """Ends the phase, which started at the end of the previous one. Idle phases (sleeping) are not work."""
+        if not self.enabled or self.scene is None:
+            return
+        now = time.perf_counter()
+        duration = now - self.last
+        self.last = now
+        if not idle:
+            self.work += duration
+        self.record(phase, duration)
+
+    def sample(self, name, duration):
+        """Records a duration measured across frames, like the latency of input, with the phases of the current scene."""
+        if self.enabled and self.scene is not None:
+            self.record(name, duration)
+
+    def record(self, phase, duration):
+        key = (self.scene, phase)
+        if key not in self.recent:
+            self.recent[key] = deque(maxlen=self.size)
+            self.histograms[key] = Histogram()
+        self.recent[key].append(duration)
+        self.histograms[key].add(duration)
+
+    def summary(self, scene):
+        """(phase, p50, p95, p99) in seconds for recent frames of the scene, the whole frame last."""
+        rows = []
+        for (row_scene, phase), durations in self.recent.items():
+            if row_scene == scene and durations:
+                values = sorted(durations)
+                rows.append((phase, percentile(values, 50), percentile(values, 95), percentile(values, 99)))
+        rows.sort(key=lambda row: row[0] == FRAME)
+        return rows
+
+    def dump(self, directory):
+        """Writes a histogram of every phase as directory/scene-phase.hgrm, returns the number of files."""
+        directory.mkdir(exist_ok=True)
+        for (scene, phase), histogram in self.histograms.items():
+            (directory / f"{scene}-{phase}.hgrm").write_text(histogram.to_hgrm())
+        return len(self.histograms)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Compact deterministic replays of games.
+A replay is the seed of the game plus the changes of direction, so simulating it with SnakeEngine
+reproduces the game exactly, including every apple and banana spawn. Checksums of the game state
+every Replay.checkpoint_interval moves detect a diverging simulation soon after it happens.
+
+Usage: python3 replay.py FILE [--speed MULTIPLIER | --fast]
+"""
+
+import argparse
+from pathlib import Path
+import struct
+import sys
+import time
+import zlib
+
+from engine import DIRECTIONS, SnakeEngine
+
+MAGIC = b"SNRP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBHHHIQ")  # magic, format version, cols, rows, speed, banana lifetime, seed
+CHECKSUM = struct.Struct("<H")
+
+
+class ReplayDivergence(Exception):
+    pass
+
+
+def write_varint(buffer, n):
+    while n >= 0x80:
+        buffer.append(n & 0x7F | 0x80)
+        n >>= 7
+    buffer.append(n)
+
+
+def read_varint(content, offset):
+    n = shift = 0
+    while True:
+        byte = content[offset]
+        offset += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, offset
+        shift += 7
+
+
+def state_checksum(engine):
+    state = (engine.ticks, engine.head, engine.score, len(engine.body), engine.apple, engine.banana)
+    return zlib.crc32(repr(state).encode()) & 0xFFFF
+
+
+class Replay:
+    """
+    Recording: call before_step() and after_step() around every SnakeEngine.step() of the game, then finish().
+    Playback: start() an engine and call step() with it until it returns False.
+    """
+    checkpoint_interval = 32  # moves
+
+    def __init__(self, cols, rows, speed, banana_lifetime, seed):
+        self.cols = cols
+        self.rows = rows
+        self.speed = speed
+        self.banana_lifetime = banana_lifetime
+        self.seed = seed
+        self.events = []  # (tick, index of direction in DIRECTIONS), the direction is used from that move on
+        self.checksums = []  # after every checkpoint_interval moves
+        self.ticks = 0  # moves of the whole game
+        self.score = 0
+        self.final_checksum = 0  # of the state after the last move
+        self.direction = (0, 0)
+
+    @classmethod
+    def for_engine(cls, engine, speed, seed):
+        return cls(engine.cols, engine.rows, speed, engine.banana_lifetime, seed)
+
+    # Recording
+
+    def before_step(self, engine):
+        if (engine.dirx, engine.diry) != self.direction:
+            self.direction = (engine.dirx, engine.diry)
+            self.events.append((engine.ticks, DIRECTIONS.index(self.direction)))
+
+    def after_step(self, engine):
+        if engine.ticks % self.checkpoint_interval == 0:
+            self.checksums.append(state_checksum(engine))
+
+    def finish(self, engine):
+        self.ticks = engine.ticks
+        self.score = engine.score
+        self.final_checksum = state_checksum(engine)
+
+    # Playback
+
+    def start(self, engine):
+        engine.cols = self.cols
+        engine.rows = self.rows
+        engine.banana_lifetime = self.banana_lifetime
+        engine.reset(self.seed)
+        self.next_event = 0
+
+    def step(self, engine):
+        """Makes the next recorded move, returns False after the last one. Raises ReplayDivergence on a checksum mismatch."""
+        if engine.ticks >= self.ticks or engine.over:
+            return False
+        if self.next_event < len(self.events) and self.events[self.next_event][0] == engine.ticks:
+            engine.dirx, engine.diry = DIRECTIONS[self.events[self.next_event][1]]
+            self.next_event += 1
+        engine.step()
+        checkpoint, remainder = divmod(engine.ticks, self.checkpoint_interval)
+        if not remainder and 0 < checkpoint <= len(self.checksums) and state_checksum(engine) != self.checksums[checkpoint - 1]:
+            raise ReplayDivergence(f"state differs from the recording after move {engine.ticks}")
+        return engine.ticks < self.ticks and not engine.over
+
+    def play(self, engine=None, multiplier=None):
+        """
+        Simulates the whole replay, in real time multiplied by multiplier, or as fast as possible if it is None.
+        Returns the engine in its final state. Raises ReplayDivergence if the result differs from the recording.
+        """
+        if engine is None:
+            engine = SnakeEngine(self.cols, self.rows)
+        self.start(engine)
+        interval = 1 / (self.speed * multiplier) if multiplier else 0
+        next_move = time.perf_counter()
+        while self.step(engine):
+            if interval:
+                next_move += interval
+                time.sleep(max(next_move - time.perf_counter(), 0))
+        if engine.ticks != self.ticks or engine.score != self.score or state_checksum(engine) != self.final_checksum:
+            raise ReplayDivergence(f"replay ended after {engine.ticks} moves with score {engine.score}, recorded {self.ticks} moves with score {self.score}")
+        return engine
+
+    # Encoding
+
+    def encode(self):
+        content = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, self.cols, self.rows, self.speed, self.banana_lifetime, self.seed))
+        write_varint(content, len(self.events))
+        previous = 0
+        for tick, direction in self.events:  # delta-encoded ticks, direction in the lowest 2 bits
+            write_varint(content, (tick - previous) << 2 | direction)
+            previous = tick
+        write_varint(content, self.ticks)
+        write_varint(content, self.score)
+        write_varint(content, self.checkpoint_interval)
+        write_varint(content, len(self.checksums))
+        for checksum in self.checksums:
+            content += CHECKSUM.pack(checksum)
+        content += CHECKSUM.pack(self.final_checksum)
+        return bytes(content)
+
+    @classmethod
+    def decode(cls, content):
+        magic, format_version, cols, rows, speed, banana_lifetime, seed = HEADER.unpack_from(content)
+        if magic != MAGIC or format_version > FORMAT_VERSION:
+            raise ValueError("not a replay of a known format")
+        replay = cls(cols, rows, speed, banana_lifetime, seed)
+        count, offset = read_varint(content, HEADER.size)
+        tick = 0
+        for _ in range(count):
+            value, offset = read_varint(content, offset)
+            tick += value >> 2
+            replay.events.append((tick, value & 3))
+        replay.ticks, offset = read_varint(content, offset)
+        replay.score, offset = read_varint(content, offset)
+        replay.checkpoint_interval, offset = read_varint(content, offset)
+        count, offset = read_varint(content, offset)
+        end = offset + count * CHECKSUM.size
+        replay.checksums = [checksum for checksum, in CHECKSUM.iter_unpack(content[offset:end])]
+        replay.final_checksum, = CHECKSUM.unpack_from(content, end)
+        if replay.events:  # recording can go on, after a game is resumed (see snapshot.py)
+            replay.direction = DIRECTIONS[replay.events[-1][1]]
+        return replay
+
+    def save(self, path):
+        path.write_bytes(self.encode())
+
+    @classmethod
+    def load(cls, path):
+        return cls.decode(path.read_bytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays a replay of Snake headless and verifies that it reproduces the recorded game.")
+    parser.add_argument("file", type=Path)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--speed", type=float, default=None, help="multiplier of the real speed of the game")
+    group.add_argument("--fast", action="store_true", help="as fast as possible (default)")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.file)
+    print(f"{args.file.name}: {args.file.stat().st_size} bytes, speed {replay.speed}, {replay.ticks} moves, {len(replay.events)} turns")
+    start = time.perf_counter()
+    try:
+        engine = replay.play(multiplier=None if args.fast else args.speed)
+    except ReplayDivergence as err:
+        print(f"Replay diverged: {err}")
+        sys.exit(1)
+    print(f"Verified: score {engine.score}, cause {engine.cause or 'quit'}, simulated in {time.perf_counter() - start:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
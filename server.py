@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Server hosting many independent games of Snake over TCP, on one asyncio loop and without pygame.
+Every connection is a session playing SnakeEngine games, which move on their own schedule at the speed chosen
+by the client. The protocol is line-based text, cells are "x y" and a missing fruit is "- -".
+
+Client to server:
+    START <speed>       new game, speed is one of SPEEDS (moves per second), also after the end of a game
+    L | R | U | D       turn, queued like key presses in the game (TurnQueue)
+    QUIT
+Server to client:
+    GAME <cols> <rows> <speed> <seed> <head> <apple> <banana>
+    T <tick> <head> <popped> <score> <apple> <banana>       after every move, popped tail cells were removed
+    OVER <cause> <score> <ticks>
+    ERR <message>
+
+A client that reads slower than its game writes is pushed back: its game waits while more than
+Session.high_water bytes are unsent and the session is closed if that lasts Session.drain_timeout seconds.
+Run: python3 server.py [--host HOST] [--port PORT] [--stats SECONDS]
+"""
+
+import argparse
+import asyncio
+import logging
+from random import randrange
+import time
+
+from engine import SnakeEngine, TurnQueue, LEFT, RIGHT, UP, DOWN, SPEEDS, COLS, ROWS, BANANA_SECONDS
+from profiler import percentile
+
+TURNS = {b"L": LEFT, b"R": RIGHT, b"U": UP, b"D": DOWN}
+
+logger = logging.getLogger("server")
+
+
+def cell_text(cell):
+    return "- -" if cell is None else f"{cell[0]} {cell[1]}"
+
+
+class Session:
+    """One connection, playing one game at a time."""
+    high_water = 16 * 1024  # bytes of unsent output above which the game waits for the client
+    drain_timeout = 10  # seconds
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.engine = None
+        self.turn_queue = TurnQueue()
+        self.game = None  # task of the current game
+        writer.transport.set_write_buffer_limits(high=self.high_water)
+
+    def send(self, line):
+        self.writer.write(line.encode() + b"\n")
+
+    async def flush(self):
+        """Waits while too much output is unsent. Closes the connection and returns False if the client stopped reading."""
+        if self.writer.transport.get_write_buffer_size() <= self.high_water:
+            return True
+        try:
+            await asyncio.wait_for(self.writer.drain(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.info("Closing a session whose client does not read")
+            self.writer.close()
+            return False
+        return True
+
+    async def run(self):
+        try:
+            while line := await self.reader.readline():
+                if not (words := line.split()):
+                    continue
+                command, *args = words
+                if command == b"START":
+                    self.start(args)
+                elif command in TURNS:
+                    if self.engine is not None and not self.engine.over:
+                        self.turn_queue.push(self.engine, TURNS[command])
+                elif command == b"QUIT":
+                    break
+                else:
+                    self.send("ERR unknown command")
+                if not await self.flush():  # stop reading commands of a client that does not read the answers
+                    break
+        except (ConnectionError, ValueError):  # ValueError: line longer than the limit of the reader
+            pass
+        finally:
+            if self.game is not None:
+                self.game.cancel()
+            self.writer.close()
+
+    def start(self, args):
+        try:
+            speed = int(args[0])
+        except (IndexError, ValueError):
+            speed = None
+        if speed not in SPEEDS:
+            self.send(f"ERR speed must be one of {' '.join(map(str, SPEEDS))}")
+            return
+        if self.game is not None:
+            self.game.cancel()
+        seed = randrange(2 ** 32)
+        self.engine = SnakeEngine(COLS, ROWS, seed=seed, banana_lifetime=BANANA_SECONDS * speed)
+        self.turn_queue.clear()
+        engine = self.engine
+        self.send(f"GAME {COLS} {ROWS} {speed} {seed} {cell_text(engine.head)} {cell_text(engine.apple)} {cell_text(engine.banana)}")
+        self.game = asyncio.create_task(self.play(engine, speed))
+
+    async def play(self, engine, speed):
+        """Moves the snake every 1 / speed seconds, counted from the start so that delays do not add up."""
+        loop = asyncio.get_running_loop()
+        interval = 1 / speed
+        deadline = loop.time()
+        while True:
+            deadline += interval
+            await asyncio.sleep(deadline - loop.time())
+            lateness = loop.time() - deadline
+            self.server.tick(lateness)
+            if lateness > interval:  # missed whole moves, continue from now instead of catching up in a burst
+                deadline = loop.time()
+
+            self.turn_queue.apply(engine)
+            head = engine.head
+            length = len(engine.body)
+            engine.step()
+            if engine.head != head:
+                popped = length + 1 - len(engine.body)
+                self.send(f"T {engine.ticks} {cell_text(engine.head)} {popped} {engine.score} {cell_text(engine.apple)} {cell_text(engine.banana)}")
+            if engine.over:
+                self.send(f"OVER {engine.cause} {engine.score} {engine.ticks}")
+
+            if self.writer.transport.get_write_buffer_size() > self.high_water:
+                if not await self.flush():
+                    return
+                deadline = loop.time()
+            if engine.over:
+                return
+
+
+class GameServer:
+    def __init__(self):
+        self.reporter = None
+        self.sessions = 0
+        self.ticks = 0
+        self.lateness = None  # seconds after the deadline of every tick since the last report, only collected with a reporter
+
+    def tick(self, lateness):
+        self.ticks += 1
+        if self.lateness is not None:
+            self.lateness.append(lateness)
+
+    async def handle(self, reader, writer):
+        self.sessions += 1
+        try:
+            await Session(self, reader, writer).run()
+        finally:
+            self.sessions -= 1
+
+    async def report(self, interval):
+        """Logs the number of sessions, ticks per second and lateness of ticks every interval seconds."""
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            lateness, self.lateness = sorted(self.lateness), []
+            ticks, self.ticks = self.ticks, 0
+            if lateness:
+                logger.info(f"{self.sessions} sessions, {ticks / (now - last):.0f} ticks/s, lateness p50 "
+                            f"{percentile(lateness, 50) * 1000:.2f} ms, p99 {percentile(lateness, 99) * 1000:.2f} ms")
+            last = now
+
+    async def serve(self, host, port, stats=None):
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        logger.info(f"Listening on {', '.join(str(socket.getsockname()) for socket in server.sockets)}")
+        if stats:
+            self.lateness = []
+            self.reporter = asyncio.create_task(self.report(stats))
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--stats", type=float, metavar="SECONDS", help="log ticks per second and their lateness this often")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    try:
+        asyncio.run(GameServer().serve(args.host, args.port, args.stats))
+    except KeyboardInterrupt:
+        pass
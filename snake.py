@@ -1,19 +1,37 @@
 #!/usr/bin/env python3
 
+import argparse
+import atexit
 import base64
+from collections import OrderedDict
+import gzip
+from itertools import islice
 import json
 import logging.handlers
 import os
 from pathlib import Path
 import platform
+import queue
 from random import randrange
+import shutil
+import struct
 import sys
 import threading
+import time
 import traceback
-import webbrowser
+import zlib
 
-import pygame
-import requests
+startup_start = time.perf_counter()  # start of the startup timeline, before the heavy imports
+
+import pygame  # noqa: E402
+
+from assets import Asset, AssetDownloader  # noqa: E402
+from autopilot import Autopilot  # noqa: E402
+from engine import SnakeEngine, TurnQueue, LEFT, RIGHT, UP, DOWN, SPEEDS, COLS, ROWS, BOARD_MAX, BANANA_SECONDS  # noqa: E402
+from history import GameHistory, GameRecord, QUIT  # noqa: E402
+from profiler import FrameProfiler  # noqa: E402
+from replay import Replay, ReplayDivergence  # noqa: E402
+from snapshot import Snapshot  # noqa: E402
 
 
 ######## Classes, functions and definitions ########
@@ -42,30 +60,146 @@ class MyPath(type(Path())):
         return self.exists() and self.size() > 0
 
 
+class StartupTimelineClass:
+    """
+    Durations of the steps of startup, from the start of snake.py to the first frame of the menu.
+    With the environment variable SNAKE_STARTUP_BENCHMARK set, the game prints the timeline as JSON
+    after the first frame and quits, see benchmarks/bench_startup.py.
+    """
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.steps = {}  # name: seconds
+        self.finished = False
+
+    def mark(self, name):
+        """Ends the step with the given name."""
+        now = time.perf_counter()
+        self.steps[name] = now - self.last
+        self.last = now
+
+    def finish(self):
+        if self.finished:
+            return
+        self.mark("first frame")
+        self.finished = True
+        total = self.last - self.start
+        logger.info(f"Started in {total * 1000:.0f} ms")
+        logger.debug("Startup timeline: " + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.steps.items()))
+        if os.environ.get("SNAKE_STARTUP_BENCHMARK"):
+            print("startup-timeline " + json.dumps({"total": total, "steps": self.steps}), flush=True)
+            pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+
 class Tee:
     """
-    Duplicates the given stream into a file.
+    Duplicates the given stream into the log, as records of the logger "stderr" that go through the logging queue.
     Inspired by https://stackoverflow.com/a/616686
     """
-    def __init__(self, out_stream, filename, mode):
-        self.file = open(filename, mode)
+    def __init__(self, out_stream, logger_name="stderr"):
         self.out_stream = out_stream
-
-    def __del__(self):
-        self.file.close()
+        self.logger = logging.getLogger(logger_name)
+        self.buffer = ""  # last incomplete line
+        self.lock = threading.Lock()
 
     def write(self, data):
-        self.file.write(data)
-        self.out_stream.write(data)
+        if self.out_stream:
+            self.out_stream.write(data)
+            self.out_stream.flush()
+        with self.lock:
+            lines, newline, self.buffer = (self.buffer + data).rpartition("\n")
+        if newline:
+            self.logger.warning(lines)
+        return len(data)
 
     def flush(self):
-        self.file.flush()
+        if self.out_stream:
+            self.out_stream.flush()
 
 
-def base64_encode(text):
-    encodedtext_bytes = base64.b64encode(text.encode("utf-8"))
-    encodedtext = str(encodedtext_bytes, "utf-8")
-    return encodedtext
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records into a bounded queue, written by a QueueListener thread, so that logging never waits for the disk.
+    When the queue is full, records below WARNING are dropped, others take the place of the oldest queued record.
+    """
+    def __init__(self, size):
+        super().__init__(queue.Queue(size))
+        self.dropped = 0
+
+    def enqueue(self, record):
+        # handle() holds the lock of the handler, and the listener only takes records, so there is room for those put here
+        if self.queue.full():
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+        elif self.dropped and self.queue.maxsize - self.queue.qsize() >= 2:
+            self.queue.put_nowait(logging.makeLogRecord({"levelno": logging.WARNING, "levelname": "WARNING", "funcName": "enqueue", "msg": f"{self.dropped} log records dropped, logging could not keep up"}))
+            self.dropped = 0
+        self.queue.put_nowait(record)
+
+
+class LogQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # waits for room in the bounded queue
+
+
+class LogFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotates 1.log into gzipped 2.log.gz, 3.log.gz… when it gets too big and at the first record of a session.
+    Runs in the thread of the QueueListener, so neither writing nor compressing blocks the game.
+    """
+    def __init__(self, path, max_bytes, backups):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        self.rollover_at_start = path.exists() and path.stat().st_size > 0
+
+    def shouldRollover(self, record):
+        if self.rollover_at_start:
+            self.rollover_at_start = False
+            return True
+        return super().shouldRollover(record)
+
+    def rotation_filename(self, default_name):
+        """1.log.1 → 2.log.gz"""
+        path = Path(default_name)
+        return str(path.with_name(f"{int(path.suffix[1:]) + 1}.log.gz"))
+
+    def rotate(self, source, dest):
+        if os.path.exists(source):
+            with open(source, "rb") as file_in, gzip.open(dest, "wb") as file_out:
+                shutil.copyfileobj(file_in, file_out)
+            os.remove(source)
+
+    def handleError(self, record):
+        if sys.__stderr__:  # not into sys.stderr, which comes back here through Tee
+            traceback.print_exc(file=sys.__stderr__)
+
+
+class LogFormatter(logging.Formatter):
+    def format(self, record):
+        if record.name == "stderr":  # output of Tee is written as it is
+            return record.getMessage()
+        return super().format(record)
+
+
+def write_atomic(path, content):
+    """Writes bytes via a temporary file and a rename, so that after a crash the file has either its old or its new content."""
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+    if os.name != "nt":  # make the rename itself durable
+        fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
 
 def base64_decode(text):
@@ -74,6 +208,54 @@ def base64_decode(text):
     return decodedtext
 
 
+# Binary game data: header (magic, format version, payload length, CRC32 of payload) followed by the payload:
+# game version (length-prefixed UTF-8), speed, highscore, total games, total time, volume in percent,
+# number of per-speed highscores and (speed, highscore) pairs. Highscores and totals are those from before the game
+# history existed, they are only read to start its statistics (see GameHistory.base) and kept as they are.
+SAVE_MAGIC = b"SNAK"
+SAVE_FORMAT_VERSION = 1
+SAVE_HEADER = struct.Struct("<4sHII")
+SAVE_FIELDS = struct.Struct("<HIIdB")
+SAVE_HIGHSCORE = struct.Struct("<HI")
+
+
+def encode_save(datadict):
+    version = datadict.get("version", "").encode("utf-8")
+    highscores_speed = datadict.get("highscores_speed", {})
+    payload = bytearray([len(version)]) + version
+    payload += SAVE_FIELDS.pack(datadict.get("speed", 0), datadict.get("highscore", 0), datadict.get("total_games", 0),
+                                datadict.get("total_time", 0), round(datadict.get("volume", 0.9) * 100))
+    payload.append(len(highscores_speed))
+    for speed, score in highscores_speed.items():
+        payload += SAVE_HIGHSCORE.pack(int(speed), score)
+    return SAVE_HEADER.pack(SAVE_MAGIC, SAVE_FORMAT_VERSION, len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_save(content):
+    """Raises ValueError if the content is not valid game data."""
+    if len(content) < SAVE_HEADER.size:
+        raise ValueError("game data is truncated")
+    magic, format_version, length, checksum = SAVE_HEADER.unpack_from(content)
+    if magic != SAVE_MAGIC or format_version > SAVE_FORMAT_VERSION:
+        raise ValueError("unknown format of game data")
+    payload = content[SAVE_HEADER.size:SAVE_HEADER.size + length]
+    if len(payload) != length or zlib.crc32(payload) != checksum:
+        raise ValueError("checksum of game data does not match")
+
+    try:
+        offset = payload[0] + 1
+        datadict = {"version": payload[1:offset].decode("utf-8")}
+        speed, datadict["highscore"], datadict["total_games"], datadict["total_time"], volume = SAVE_FIELDS.unpack_from(payload, offset)
+        if speed:
+            datadict["speed"] = speed
+        datadict["volume"] = volume / 100
+        offset += SAVE_FIELDS.size
+        datadict["highscores_speed"] = {str(speed): score for speed, score in SAVE_HIGHSCORE.iter_unpack(payload[offset + 1:offset + 1 + payload[offset] * SAVE_HIGHSCORE.size])}
+    except (IndexError, struct.error) as err:
+        raise ValueError(f"game data is malformed: {err}")
+    return datadict
+
+
 def format_time(seconds, milliseconds=False):
     if milliseconds:
         return f"{seconds // 60:02.0f}:{seconds % 60:06.3f}"
@@ -84,13 +266,48 @@ def format_time(seconds, milliseconds=False):
         return f"{minutes:02}:{seconds:02}"
 
 
+class TextCacheClass:
+    """
+    Caches opened fonts and rendered texts, so that a text is rasterized again only when it changes.
+    Rendered surfaces are shared between Text objects, so they must not be drawn on.
+    """
+    def __init__(self, max_size=256):
+        self.fonts = {}
+        self.surfaces = OrderedDict()  # least recently used first
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, font_size, sysfont=False):
+        key = (conf.path_font, font_size, sysfont)
+        if key not in self.fonts:
+            if sysfont:
+                self.fonts[key] = pygame.font.SysFont("Verdana", font_size, bold=True)
+            else:
+                self.fonts[key] = pygame.font.Font(conf.path_font, font_size)
+        return self.fonts[key]
+
+    def render(self, text, color, font_size, sysfont=False):
+        key = (text, tuple(color), font_size, sysfont)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            self.misses += 1
+            surface = self.font(font_size, sysfont).render(text, True, color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def stats(self):
+        return f"{self.hits} hits, {self.misses} misses, {len(self.surfaces)} surfaces, {len(self.fonts)} fonts"
+
+
 class Text:
     def __init__(self, text, color, font_size, sysfont=False):
-        if sysfont:
-            self.font = pygame.font.SysFont("Verdana", font_size, bold=True)
-        else:
-            self.font = pygame.font.Font(conf.path_font, font_size)
-        self.text = self.font.render(text, True, color)
+        self.text = TextCache.render(text, color, font_size, sysfont)
         self.width, self.height = self.text.get_size()
 
     def draw(self, x, y):
@@ -155,8 +372,34 @@ class RoundedRectangle:
         pygame.draw.rect(window, self.color, (x, y, self.width, self.height), border_radius=self.radius)
 
 
-def draw_tile(color, x, y):
-    pygame.draw.rect(window, color, (x, y, conf.tile_width, conf.tile_width), border_radius=conf.tile_radius)
+class TileSpritesClass:
+    """Pre-rendered rounded tiles, blitting them is much faster than rasterizing a rounded rectangle every time."""
+    colorkey = (255, 0, 255)
+
+    def __init__(self):
+        self.sprites = {}
+
+    def get(self, color):
+        key = (tuple(color), conf.tile_width, conf.tile_radius)  # rendered again when conf changes
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = pygame.Surface((conf.tile_width, conf.tile_width))
+            colorkey = (0, 0, 0) if key[0] == self.colorkey else self.colorkey
+            sprite.fill(colorkey)
+            sprite.set_colorkey(colorkey)
+            pygame.draw.rect(sprite, color, (0, 0, conf.tile_width, conf.tile_width), border_radius=conf.tile_radius)
+            self.sprites[key] = sprite
+        return sprite
+
+    def prerender(self, colors):
+        for color in colors:
+            self.get(color)
+
+
+def draw_tile(color, x, y, surface=None):
+    if surface is None:
+        surface = window
+    surface.blit(TileSprites.get(color), (x, y))
 
 
 class Button:
@@ -246,12 +489,23 @@ class ButtonSpeedGroup:
                     self.dec, self.inc = False, False
 
 
+class ButtonAutopilot(Button):
+    def is_highlighted(self):
+        return super().is_pointed() or conf.autopilot
+
+
 class ButtonCmds:
     @staticmethod
     def gameTrue():
         global game
         game = True
 
+    @staticmethod
+    def newGame():
+        global game
+        SavedGame.discard()
+        game = True
+
     @staticmethod
     def menuFalse():
         global menu
@@ -267,30 +521,52 @@ class ButtonCmds:
         global creditss
         creditss = False
 
+    @staticmethod
+    def autopilotToggle():
+        conf.autopilot = not conf.autopilot
+        MenuScreen.invalidate()
+        logger.info(f"Autopilot {'on' if conf.autopilot else 'off'}")
+
 
 class File:  # Data
+    """
+    Game data is written behind: write() only marks it dirty and a background thread saves it conf.data_write_delay
+    after the last change, so bursts of changes (e.g. volume clicks) are coalesced into a single write.
+    flush() saves pending changes synchronously and has to be called on quit.
+    """
     def __init__(self):
         self.path_data = conf.path_data
+        self.condition = threading.Condition()
+        self.dirty_since = None  # time of the last unsaved change
+        self.flush_lock = threading.Lock()
+        self.writer = threading.Thread(target=self.writer_loop, name="DataWriter", daemon=True)
+        self.writer.start()
+
+    @staticmethod
+    def read_file(path):
+        """Reads game data in the binary format or in the old one (Base64 encoded JSON, up to v1.6.0)."""
+        content = path.read_bytes()
+        if content.startswith(SAVE_MAGIC):
+            return decode_save(content), False
+        return json.loads(base64_decode(content.split(b"\n", 1)[0])), True
 
     def read(self):
         try:
-            with conf.path_version.open("r") as file:
-                self.version = base64_decode(file.readline())
-
-            with self.path_data.open("r") as file:
-                data = base64_decode(file.readline())
-
-            self.datadict = json.loads(data)
-            self.highscore = self.datadict.get("highscore", 0)
-            highscores_speed = self.datadict.get("highscores_speed", {})
-            self.highscores_speed = {i: highscores_speed.get(i, 0) for i in map(str, sorted(conf.speed_list))}
-            self.total_games = self.datadict.get("total_games", 0)
-            self.total_time = self.datadict.get("total_time", 0)
+            try:
+                self.datadict, old_format = self.read_file(self.path_data)
+            except ValueError as err:
+                logger.warning(f"Game data is damaged ({err}), reading the backup")
+                self.datadict, old_format = self.read_file(conf.path_data_backup)
+                self.write()
+
+            if old_format:
+                logger.info("Migrating game data to the binary format")
+                self.write()
+
             self.volume = self.datadict.get("volume", 0.9)
 
             if "speed" in self.datadict:
                 conf.speed = self.datadict["speed"]
-                conf.move_delay = conf.fps // conf.speed
 
         except:
             logger.exception("Error while reading game data:")
@@ -300,179 +576,413 @@ class File:  # Data
             logger.info("Game data successfully read")
 
     def write(self):
-        try:
-            logger.debug("Writing data")
-            conf.path_data.replace(conf.path_data_backup)
-            self.datadict["version"] = conf.version
-            self.datadict["speed"] = conf.speed
-            self.datadict["highscore"] = self.highscore
-            self.datadict["highscores_speed"] = self.highscores_speed
-            self.datadict["total_games"] = self.total_games
-            self.datadict["total_time"] = round(self.total_time, 3)
-            self.datadict["volume"] = round(self.volume, 1)
-            with self.path_data.open("w") as file:
-                file.write(self.dump_data())
-                file.write("\neyJqdXN0IGZvdW5kIGFuIEVhc3RlciBFZ2c/PyI6IHRydWV9")
-            conf.path_version.write_text(base64_encode(conf.version))
+        with self.condition:
+            self.dirty_since = time.monotonic()
+            self.condition.notify()
+
+    def writer_loop(self):
+        while True:
+            with self.condition:
+                # every further change postpones the write, and flush() may write it meanwhile, so the wait starts over
+                while self.dirty_since is None or (delay := self.dirty_since + conf.data_write_delay - time.monotonic()) > 0:
+                    self.condition.wait(None if self.dirty_since is None else delay)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error while writing game data:")
 
-        except Exception as err:
-            logger.error(err)
-            logger.error(traceback.format_exc())
-            error_screen("Error while writing game data")
+    def flush(self):
+        with self.flush_lock:
+            with self.condition:
+                if self.dirty_since is None:
+                    return
+                self.dirty_since = None
+                logger.debug("Writing data")
+                self.datadict["version"] = conf.version
+                self.datadict["speed"] = conf.speed
+                self.datadict["volume"] = round(self.volume, 1)
+                content = encode_save(self.datadict)
+
+            # the backup is kept only if it is valid, so that a damaged file never replaces a good backup
+            try:
+                previous = self.path_data.read_bytes()
+                decode_save(previous)
+            except (OSError, ValueError):
+                pass
+            else:
+                write_atomic(conf.path_data_backup, previous)
+            write_atomic(self.path_data, content)
+            if conf.path_version_old.exists():  # version is stored in the game data since the binary format
+                conf.path_version_old.unlink()
 
     def dump_data(self):
-        return base64_encode(json.dumps(self.datadict, separators=(",", ":")))
+        return json.dumps(self.datadict, separators=(",", ":"))
+
+
+class SavedGameClass:
+    """
+    Game left with Escape, resumed by the next game, also after a restart. The engine of the game is handed over to
+    a thread, which encodes it (see snapshot.py) and writes it to conf.path_save, so leaving costs the game loop nothing.
+    The game stays in memory until it is resumed, and a save found at start is decoded by a thread too, so resuming
+    does not wait for the engine to be rebuilt either.
+    """
+    def __init__(self):
+        self.exists = conf.path_save.is_good()
+        self.writer = None
+        self.snapshot = None  # game to resume once the reader is done
+        self.error = None  # why the save found at start cannot be resumed
+        self.reader = None
+        if self.exists:
+            self.reader = threading.Thread(target=self.read, name="SaveReader", daemon=True)
+            self.reader.start()
+
+    def save(self, snapshot):
+        self.exists = True
+        self.snapshot = snapshot
+        self.writer = threading.Thread(target=self.write, args=(snapshot,), name="SaveWriter")
+        self.writer.start()
+
+    @staticmethod
+    def write(snapshot):
+        try:
+            start = time.perf_counter()
+            content = snapshot.encode()
+            encoded = time.perf_counter()
+            write_atomic(conf.path_save, content)
+            logger.info(f"Game saved, {len(content)} bytes encoded in {(encoded - start) * 1000:.2f} ms and written in {(time.perf_counter() - encoded) * 1000:.2f} ms")
+        except Exception:
+            logger.exception("Error while saving the game:")
+
+    def read(self):
+        try:
+            start = time.perf_counter()
+            self.snapshot = Snapshot.decode(conf.path_save.read_bytes())
+            logger.info(f"Saved game decoded in {(time.perf_counter() - start) * 1000:.2f} ms")
+        except (OSError, ValueError) as err:
+            self.error = err
+
+    def wait(self):
+        """Waits until the game being saved is written, has to be called on quit."""
+        if self.writer is not None:
+            self.writer.join()
+
+    def discard(self):
+        """Removes the saved game, for a new game started instead of resuming it."""
+        self.wait()
+        if self.reader is not None:
+            self.reader.join()
+        self.exists = False
+        self.snapshot = None
+        conf.path_save.unlink(missing_ok=True)
+        logger.info("Saved game discarded")
+
+    def load(self):
+        """Returns the Snapshot of the saved game, None if it cannot be read. A game is resumed only once, the save is removed."""
+        self.wait()
+        if self.reader is not None:
+            self.reader.join()
+        snapshot = self.snapshot
+        if snapshot is None:
+            logger.warning(f"Saved game cannot be resumed ({self.error})")
+        self.exists = False
+        self.snapshot = None
+        conf.path_save.unlink(missing_ok=True)
+        return snapshot
 
 
-def download_if_needed(path: MyPath, url, name):
-    if not path.is_good():
-        logger.warning(f"{name} did not exist, trying to download")
+def checkFiles():
+    if not conf.path_data.is_good():
+        logger.warning("Data file did not exist, trying to create")
+        write_atomic(conf.path_data, encode_save({"version": conf.version}))
+        logger.warning("Data file successfully created")
+
+    downloader = AssetDownloader(conf.path_assetsDir, conf.assets)
+    missing = downloader.missing()
+    if missing:
+        logger.warning(f"{', '.join(asset.name for asset in missing)} did not exist or were damaged, trying to download")
         try:
-            download = requests.get(url, allow_redirects=True)
-            path.write_bytes(download.content)
+            downloader.download_all(missing)
         except Exception as err:
             logger.error(err)
             logger.error(traceback.format_exc())
             raise err
         else:
-            logger.warning(f"{name} successfully downloaded")
+            logger.warning("Assets successfully downloaded")
 
+    logger.info("Checking files done")
 
-def checkFiles():
-    if not conf.path_version.is_good():
-        logger.warning("Version file did not exist, trying to create")
-        conf.path_version.write_text(base64_encode(conf.version))
-        logger.warning("Version file successfully created")
 
-    if not conf.path_data.is_good():
-        logger.warning("Data file did not exist, trying to create")
-        with conf.path_data.open("w") as file:
-            file.write(base64_encode(json.dumps({})))
-            file.write("\neyJqdXN0IGZvdW5kIGFuIEVhc3RlciBFZ2c/PyI6IHRydWV9")
-        logger.warning("Data file successfully created")
+def cell_position(cell):
+    """Converts board cell (column, row) to window pixel coordinates of the tile, in the view of the camera."""
+    return conf.game_x + (cell[0] - Camera.x) * conf.grid + conf.grid_border, conf.game_y + (cell[1] - Camera.y) * conf.grid + conf.grid_border
 
-    download_if_needed(conf.path_font, conf.url_font, "Font")
-    download_if_needed(conf.path_music_Game, conf.url_music_Game, "Game music")
-    download_if_needed(conf.path_music_GameOver, conf.url_music_GameOver, "GameOver music")
 
-    logger.info("Checking files done")
+class CameraClass:
+    """
+    Part of the board shown in the game area, cols × rows cells from (x, y).
+    On boards bigger than the game area it follows the head, scrolling when the head comes closer than
+    conf.camera_margin cells to an edge of the view, so drawing costs the same on a board of any size.
+    """
+    def __init__(self):
+        self.cols = conf.game_width // conf.grid
+        self.rows = conf.game_height // conf.grid
+        self.x = 0
+        self.y = 0
+
+    @property
+    def scrolling(self):
+        return Snake.engine.cols > self.cols or Snake.engine.rows > self.rows
+
+    def center(self, cell):
+        self.x = min(max(cell[0] - self.cols // 2, 0), max(Snake.engine.cols - self.cols, 0))
+        self.y = min(max(cell[1] - self.rows // 2, 0), max(Snake.engine.rows - self.rows, 0))
+
+    def follow(self, cell):
+        x, y = cell
+        margin = conf.camera_margin
+        if x < self.x + margin:
+            self.x = max(x - margin, 0)
+        elif x >= self.x + self.cols - margin:
+            self.x = min(x + margin - self.cols + 1, max(Snake.engine.cols - self.cols, 0))
+        if y < self.y + margin:
+            self.y = max(y - margin, 0)
+        elif y >= self.y + self.rows - margin:
+            self.y = min(y + margin - self.rows + 1, max(Snake.engine.rows - self.rows, 0))
+
+    def visible(self, cell):
+        return 0 <= cell[0] - self.x < self.cols and 0 <= cell[1] - self.y < self.rows
+
+    def cells(self):
+        return ((x, y) for y in range(self.y, self.y + self.rows) for x in range(self.x, self.x + self.cols))
 
 
 class SnakeClass:
     def __init__(self):
-        self.velocity = conf.grid
         self.color_head = (255, 255, 255)
         self.colors_tail = [(3, 255, 3), (2, 232, 2), (1, 187, 0)]
         self.colors_tail_len = len(self.colors_tail)
+        self.sprites_tail = []  # tail sprites repeated in reverse order, see draw()
+        self.engine = SnakeEngine(conf.board_cols, conf.board_rows)
+        self.turn_queue = TurnQueue(conf.input_queue_depth)
+        self.turns_made = []  # request times of turns made by moves which are not on the screen yet
         self.reinit()
 
-    def reinit(self):
-        self.dirx = 0
-        self.diry = 0
-        self.dirx_current = 0
-        self.diry_current = 0
-        self.x = (conf.game_width - conf.grid) // 2 + conf.game_x
-        self.y = (conf.game_height - conf.grid) // 2 + conf.game_y
-        self.xyList = [(self.x + conf.grid_border, self.y + conf.grid_border)]
-        self.fpsCounter = 0
-        self.score = 0
-
-    def change_dir_left(self):
-        if self.dirx_current == 0:
-            self.dirx = -self.velocity
-            self.diry = 0
-
-    def change_dir_right(self):
-        if self.dirx_current == 0:
-            self.dirx = self.velocity
-            self.diry = 0
-
-    def change_dir_up(self):
-        if self.diry_current == 0:
-            self.dirx = 0
-            self.diry = -self.velocity
-
-    def change_dir_down(self):
-        if self.diry_current == 0:
-            self.dirx = 0
-            self.diry = self.velocity
+    def reinit(self, snapshot=None):
+        """Sets up a new game, or the saved game of snapshot, which goes on with the first turn."""
+        if snapshot is None:
+            seed = randrange(2 ** 32)
+            self.speed = conf.speed
+            self.engine.cols = conf.board_cols  # a replay may have changed the board
+            self.engine.rows = conf.board_rows
+            self.engine.banana_lifetime = Banana.lifetime_default * self.speed
+            self.engine.reset(seed)
+            self.replay = Replay.for_engine(self.engine, self.speed, seed)
+        else:
+            self.engine = snapshot.engine
+            self.speed = snapshot.speed
+            self.replay = snapshot.replay
+        self.engine.changed = None  # until GameScreen.draw_full() takes the changes over
+        self.paused = snapshot is not None
+        self.turn_queue.clear()
+        self.turns_made.clear()
+        self.autopilot = Autopilot(self.engine) if conf.autopilot else None
+        self.previous_head = self.engine.head
+
+    def take_snapshot(self):
+        """Snapshot of the game for saving. It takes the engine over, the snake gets a new one."""
+        snapshot = Snapshot(self.engine, self.speed, self.replay)
+        self.engine = SnakeEngine(conf.board_cols, conf.board_rows)
+        return snapshot
+
+    @property
+    def time(self):
+        """Seconds since the first move, counted by the logic clock."""
+        return max(self.engine.ticks - 1, 0) / self.speed
+
+    @property
+    def score(self):
+        return self.engine.score
+
+    @property
+    def dirx(self):
+        return self.engine.dirx
+
+    @property
+    def diry(self):
+        return self.engine.diry
+
+    def turn(self, direction):
+        """Queues a turn for the next free move, see TurnQueue. The autopilot does not take orders."""
+        self.paused = False
+        if self.autopilot is None:
+            self.turn_queue.push(self.engine, direction, time.perf_counter())
+
+    def steer(self):
+        """Turns where the autopilot wants to go, before a move."""
+        if (direction := self.autopilot.direction()) is not None:
+            self.engine.turn(direction)
 
     def move(self):
         global game_notOver
-        self.dirx_current = self.dirx
-        self.diry_current = self.diry
-
-        if self.dirx != 0:
-            self.x += self.dirx
-        elif self.diry != 0:
-            self.y += self.diry
-        self.head_location = (self.x + conf.grid_border, self.y + conf.grid_border)
-
-        if self.x == conf.game_x - conf.grid or self.x == conf.game_width + conf.grid or self.y == conf.game_y - conf.grid or self.y == conf.game_height + conf.topbar_height:
+        if (requested := self.turn_queue.apply(self.engine)) is not None:
+            self.turns_made.append(requested)
+        self.previous_head = self.engine.head
+        self.replay.before_step(self.engine)
+        if not self.engine.step():
             game_notOver = False
-
-        for pair in self.xyList[:-1]:  # collision with itself
-            if self.head_location == pair:
-                game_notOver = False
-
-        self.xyList.append(self.head_location)
-
-        if self.head_location == Apple.location:  # ate the apple
-            self.score += 1
-            Apple.move()
+        self.replay.after_step(self.engine)
+
+    def turns_shown(self):
+        """Call after showing a frame, records the input latency of turns made since the previous one."""
+        if self.turns_made:
+            now = time.perf_counter()
+            for requested in self.turns_made:
+                Profiler.sample("input", now - requested)
+            self.turns_made.clear()
+
+    def save_replay(self):
+        """Saves the replay of the finished game, keeping only conf.replays_keep newest ones."""
+        global LastReplay
+        self.replay.finish(self.engine)
+        LastReplay = self.replay
+        try:
+            now = time.time()
+            # milliseconds and, if still taken, a counter keep names unique and sorted by time
+            name = f"{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(now))}.{int(now % 1 * 1000):03d}"
+            path = conf.path_replayDir / f"{name}.replay"
+            counter = 0
+            while path.exists():
+                counter += 1
+                path = conf.path_replayDir / f"{name}_{counter}.replay"
+            write_atomic(path, self.replay.encode())
+            for path in sorted(conf.path_replayDir.glob("*.replay"))[:-conf.replays_keep]:
+                path.unlink()
+        except OSError:
+            logger.exception("Error while saving replay:")
+
+    def tiles(self):
+        """Yields (cell, color) of every segment, from tail to head."""
+        body = self.engine.body
+        # the head entered the cells of the body on consecutive moves, see tail_color()
+        first = self.engine.occupied[self.engine.head] - len(body) + 1
+        for tick, cell in enumerate(islice(body, len(body) - 1), start=first):
+            yield cell, self.colors_tail[tick % self.colors_tail_len]
+        yield self.engine.head, self.color_head
+
+    def tail_color(self, cell):
+        """
+        Color of the segment in cell, which is that of the move the head entered the cell on. A segment keeps its
+        color until the tail leaves it, so a move changes the tiles of the head, the previous head and the tail only.
+        """
+        return self.colors_tail[self.engine.occupied[cell] % self.colors_tail_len]
+
+    def prerender(self):
+        TileSprites.prerender([self.color_head, *self.colors_tail])
+        self.sprites_tail = []
+
+    def visible_segments(self):
+        """
+        (distance from the head, cell) of the tail segments in the view of the camera.
+        Looks at the body or at the cells of the view, whichever is smaller, never at more cells than the view holds.
+        """
+        engine = self.engine
+        if len(engine.body) <= Camera.cols * Camera.rows:
+            return [(distance, cell) for distance, cell in enumerate(islice(reversed(engine.body), 1, None), start=1) if Camera.visible(cell)]
+        occupied = engine.occupied  # cell: tick when the head entered it
+        head = engine.head
+        head_tick = occupied[head]
+        return [(head_tick - occupied[cell], cell) for cell in Camera.cells() if cell in occupied and cell != head]
+
+    def draw(self, alpha=None):
+        # The segment at distance d from the head has the color of move head_tick - d (see tail_color()), so the
+        # sprites of the segments are a sequence of tail sprites in reverse order, reused between frames from an offset
+        body = self.engine.body
+        head_tick = self.engine.occupied[self.engine.head]
+        if Camera.scrolling:
+            sprites = [TileSprites.get(color) for color in self.colors_tail]
+            window.blits([(sprites[(head_tick - distance) % self.colors_tail_len], cell_position(cell)) for distance, cell in self.visible_segments()], doreturn=False)
         else:
-            self.xyList.pop(0)
-
-        if self.head_location == Banana.location:
-            self.score -= 1
-            self.xyList.pop(0)
-            if self.score < 0:
-                self.score = 0
-                game_notOver = False
-            Banana.move()
-
-    def draw(self):
-        for i, (x, y) in enumerate(self.xyList[:-1], start=1):
-            color_num = (self.score - i) % self.colors_tail_len
-            draw_tile(self.colors_tail[color_num], x, y)
-        draw_tile(self.color_head, *self.xyList[-1])
+            if len(self.sprites_tail) < len(body) + self.colors_tail_len:
+                sprites = [TileSprites.get(color) for color in reversed(self.colors_tail)]
+                self.sprites_tail = sprites * (2 * len(body) // self.colors_tail_len + 2)
+            # sprites_tail[i] has the color of move -1 - i, the segment next to the head the one of move head_tick - 1
+            offset = -head_tick % self.colors_tail_len
+            window.blits(zip(islice(self.sprites_tail, offset, None), map(cell_position, islice(reversed(body), 1, None))), doreturn=False)
+        x, y = cell_position(self.engine.head)
+        if alpha is not None:  # slide the head from its previous cell
+            x0, y0 = cell_position(self.previous_head)
+            x, y = x0 + (x - x0) * alpha, y0 + (y - y0) * alpha
+        draw_tile(self.color_head, x, y)
 
 
 class AppleClass:
     def __init__(self):
         self.color = (255, 0, 0)
         self.width = conf.tile_width
-        self.location = None
 
-    def move(self):
-        self.x = randrange(0, conf.game_width // conf.grid) * conf.grid + conf.game_x
-        self.y = randrange(0, conf.game_height // conf.grid) * conf.grid + conf.game_y
-        self.location = (self.x + conf.grid_border, self.y + conf.grid_border)
-        if self.location in Snake.xyList or self.location == Banana.location:
-            self.move()
+    @property
+    def location(self):
+        return cell_position(Snake.engine.apple)
 
     def draw(self):
-        draw_tile(self.color, *self.location)
+        if Camera.visible(Snake.engine.apple):
+            draw_tile(self.color, *self.location)
 
 
 class BananaClass:
     def __init__(self):
         self.color = (255, 255, 0)
         self.width = conf.tile_width
-        self.lifetime_default = conf.fps * 10  # seconds
-        self.location = None
+        self.lifetime_default = BANANA_SECONDS
 
-    def move(self):
-        self.x = randrange(0, conf.game_width // conf.grid) * conf.grid + conf.game_x
-        self.y = randrange(0, conf.game_height // conf.grid) * conf.grid + conf.game_y
-        self.location = (self.x + conf.grid_border, self.y + conf.grid_border)
-        if self.location in Snake.xyList or self.location == Apple.location:
-            self.move()
-        else:
-            self.lifetime = self.lifetime_default
+    @property
+    def location(self):
+        return cell_position(Snake.engine.banana)
 
     def draw(self):
-        draw_tile(self.color, *self.location)
+        if Snake.engine.banana is not None and Camera.visible(Snake.engine.banana):  # there may be no free cell for it
+            draw_tile(self.color, *self.location)
+
+
+class GameClockClass:
+    """
+    Fixed-timestep clock, the game logic ticks at exactly conf.speed Hz no matter how often frames are rendered.
+    Time of each frame is added to an accumulator and every full move interval in it is one move,
+    so after a dropped frame the missing moves are made up instead of slowing the game down.
+    """
+    max_frame_time = 0.25  # seconds, longer stalls (e.g. dragging the window) are not made up
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, speed=None):
+        self.interval = 1 / (speed or conf.speed)
+        self.accumulator = 0
+        self.started = False
+        self.last = time.perf_counter()
+
+    def update(self, started):
+        """Returns the number of moves due since the previous call."""
+        now = time.perf_counter()
+        frame_time = min(now - self.last, self.max_frame_time)
+        self.last = now
+        if not self.started:
+            if not started:
+                return 0
+            self.started = True
+            self.accumulator = self.interval  # first move as soon as the snake starts
+        else:
+            self.accumulator += frame_time
+
+        moves = 0
+        while self.accumulator >= self.interval:
+            self.accumulator -= self.interval
+            moves += 1
+        return moves
+
+    def alpha(self):
+        """Fraction of the current move interval that has already passed, for interpolated rendering."""
+        return self.accumulator / self.interval
 
 
 class TopBarClass:
@@ -482,18 +992,215 @@ class TopBarClass:
         self.width = conf.topbar_width
         self.height = conf.topbar_height
         self.font_size = int(1.04 * conf.grid)
+        self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
+
+    @staticmethod
+    def texts():
+        return (
+            f"time: {format_time(int(Snake.time))}",
+            f"score: {thousands_separators(Snake.score)}",
+            f"highscore: {thousands_separators(History.highscore(conf.speed))}"
+        )
 
     def draw(self):
-        Time = Text(f"time: {format_time(Snake.fpsCounter // conf.fps)}", conf.color_font, self.font_size)
+        time_text, score_text, highscore_text = self.texts()
+        Time = Text(time_text, conf.color_font, self.font_size)
         Time.draw(1.4 * conf.grid, (self.height - Time.height) // 2)
 
-        Score = Text(f"score: {thousands_separators(Snake.score)}", conf.color_font, self.font_size)
+        Score = Text(score_text, conf.color_font, self.font_size)
         Score.draw((self.width - Score.width) // 2, (self.height - Score.height) // 2)
 
-        HighscoreOnBar = Text(f"highscore: {thousands_separators(Data.highscores_speed[str(conf.speed)])}", conf.color_font, self.font_size)
+        HighscoreOnBar = Text(highscore_text, conf.color_font, self.font_size)
         HighscoreOnBar.draw(self.width - conf.grid - HighscoreOnBar.width - 0.4 * conf.grid, (self.height - HighscoreOnBar.height) // 2)
 
 
+class ProfilerOverlayClass:
+    """
+    Percentiles of the durations of frame phases in the current scene, over the top left corner of the board.
+    F3 or the --profile option turn it on together with the profiler.
+    """
+    def __init__(self):
+        self.shown = False
+        self.surface = None
+        self.updated = 0
+        self.font_size = 14
+        self.x = conf.game_x + conf.grid_border
+        self.y = conf.game_y + conf.grid_border
+        self.columns = (120, 170, 220)  # right edges of p50, p95 and p99
+
+    def toggle(self):
+        self.shown = not self.shown
+        Profiler.enable(self.shown)
+        self.surface = None
+        logger.info(f"Profiling {'on' if self.shown else 'off'}")
+
+    def render(self):
+        font = TextCache.font(self.font_size)
+        rows = [("ms", "p50", "p95", "p99")]
+        rows.extend((phase, f"{p50 * 1000:.2f}", f"{p95 * 1000:.2f}", f"{p99 * 1000:.2f}") for phase, p50, p95, p99 in Profiler.summary(Profiler.scene))
+        frames = Profiler.frames[Profiler.scene]
+        dropped = Profiler.dropped[Profiler.scene]
+        line_height = font.get_linesize()
+        self.surface = pygame.Surface((self.columns[-1] + 8, (len(rows) + 1) * line_height + 8))
+        self.surface.fill((30, 30, 30))
+        for i, row in enumerate(rows):
+            y = 4 + i * line_height
+            self.surface.blit(font.render(row[0], True, conf.color_font), (4, y))
+            for text, right in zip(row[1:], self.columns):
+                rendered = font.render(text, True, conf.color_font)
+                self.surface.blit(rendered, (right - rendered.get_width(), y))
+        summary = f"dropped frames: {dropped} of {frames}" + (f" ({dropped / frames:.1%})" if frames else "")
+        self.surface.blit(font.render(summary, True, conf.color_font), (4, 4 + len(rows) * line_height))
+
+    def draw(self):
+        """Draws the overlay if it is shown, returns the rectangle it covers, or None."""
+        if not self.shown:
+            return None
+        now = time.perf_counter()
+        if self.surface is None or now - self.updated > conf.profiler_overlay_interval:
+            self.render()
+            self.updated = now
+        return window.blit(self.surface, (self.x, self.y))
+
+
+class GameScreenClass:
+    """
+    Dirty-rectangle rendering of the game scene.
+    The board is kept on its own surface between frames, only the cells that changed since the previous frame
+    are repainted, and only their rectangles (plus the top bar if its texts changed) are passed to display.update().
+    The engine lists the cells its moves changed (SnakeEngine.changed), so a frame costs the same for any length.
+    """
+    def __init__(self):
+        self.board = pygame.Surface((conf.game_width, conf.game_height))
+        self.topbar_texts = None
+
+    @staticmethod
+    def tiles():
+        tiles = dict(Snake.tiles())
+        tiles[Snake.engine.apple] = Apple.color
+        if Snake.engine.banana is not None:
+            tiles[Snake.engine.banana] = Banana.color
+        return tiles
+
+    @staticmethod
+    def tile(cell):
+        """Color of the tile in cell, None if it is empty."""
+        engine = Snake.engine
+        if cell == engine.head:
+            return Snake.color_head
+        if cell in engine.occupied:
+            return Snake.tail_color(cell)
+        if cell == engine.apple:
+            return Apple.color
+        if cell == engine.banana:
+            return Banana.color
+        return None
+
+    @staticmethod
+    def board_position(cell):
+        return cell[0] * conf.grid + conf.grid_border, cell[1] * conf.grid + conf.grid_border
+
+    def draw_full(self):
+        self.board.fill(conf.color_game_background)
+        for cell, color in self.tiles().items():
+            draw_tile(color, *self.board_position(cell), surface=self.board)
+        Snake.engine.changed = []
+        window.fill(conf.color_window_background)
+        window.blit(self.board, (conf.game_x, conf.game_y))
+        TopBar.draw()
+        self.topbar_texts = TopBar.texts()
+        CurrentSpeedText.draw()
+        ProfilerOverlay.draw()
+        Profiler.mark("draw")
+        pygame.display.update()
+        Profiler.mark("flip")
+
+    def redraw(self):
+        changed = set(Snake.engine.changed)
+        changed.discard(None)
+        Snake.engine.changed.clear()
+
+        rects = []
+        for cell in changed:
+            local = pygame.Rect(self.board_position(cell), (conf.tile_width, conf.tile_width))
+            self.board.fill(conf.color_game_background, local)
+            if (color := self.tile(cell)) is not None:
+                draw_tile(color, local.x, local.y, surface=self.board)
+            rect = local.move(conf.game_x, conf.game_y)
+            window.blit(self.board, rect, local)
+            rects.append(rect)
+
+        if (texts := TopBar.texts()) != self.topbar_texts:
+            self.topbar_texts = texts
+            window.fill(conf.color_window_background, TopBar.rect)
+            TopBar.draw()
+            rects.append(TopBar.rect)
+
+        if overlay := ProfilerOverlay.draw():
+            rects.append(overlay)
+        Profiler.mark("draw")
+        pygame.display.update(rects)
+        Profiler.mark("flip")
+
+
+class MenuScreenClass:
+    """
+    The menu is kept on its own surface with every button drawn as if the mouse pointed at none. The surface is composited
+    again only after something on it changes: the update() of a widget, the speed, the volume or the autopilot, and after
+    a game. A frame of the menu is one blit of it and the buttons under the mouse, drawn over it highlighted.
+    """
+    def __init__(self):
+        self.surface = pygame.Surface((conf.window_width, conf.window_height))
+        self.valid = False
+
+    def invalidate(self):
+        self.valid = False
+
+    @staticmethod
+    def game_buttons():
+        """Resume and New game side by side while there is a saved game, Play otherwise."""
+        return [ButtonResume, ButtonNewGame] if SavedGame.exists else [ButtonPlay]
+
+    def buttons(self):
+        return [*self.game_buttons(), ButtonExit, WebsiteButton, CreditsButton, AutopilotButton,
+                *SpeedButtons.ButtonsList, VolumeWidgetInMenu.button_minus, VolumeWidgetInMenu.button_plus]
+
+    def composite(self):
+        global window
+        global mouse
+        screen, window = window, self.surface  # the widgets draw on window
+        pointer, mouse = mouse, (-1, -1)
+        try:
+            window.fill(conf.color_window_background)
+            SnakeLogo.draw((conf.window_width - SnakeLogo.width) // 2, 4.5 * conf.grid)
+            HighscoresInMenu.draw()
+            TotalStatsInMenu.draw()
+            if LastScore:
+                LastScore.draw((conf.window_width - LastScore.width) // 2, 205)
+            for button in self.game_buttons():
+                button.draw()
+            ButtonExit.draw()
+            Author.draw(conf.window_width - conf.margin - Author.width, conf.window_height - conf.margin - Author.height)
+            WebsiteButton.draw()
+            CreditsButton.draw()
+            AutopilotButton.draw()
+            SpeedText.draw(conf.window_width - conf.margin - SpeedButtons.width_total - SpeedButtons.spacing - SpeedText.width, conf.margin + (SpeedButtons.height - SpeedText.height) // 2)
+            SpeedButtons.draw()
+            VolumeWidgetInMenu.draw()
+        finally:
+            window = screen
+            mouse = pointer
+        self.valid = True
+
+    def draw(self):
+        if not self.valid:
+            self.composite()
+        window.blit(self.surface, (0, 0))
+        for button in self.buttons():
+            if button.is_pointed():
+                button.draw()
+
+
 class CurrentSpeedTextClass:
     def __init__(self):
         self.update()
@@ -519,8 +1226,9 @@ class HighscoresInMenuClass:
         self.y_bottom = self.y2 + self.text2.height
 
     def update(self):
+        MenuScreen.invalidate()
         self.text1 = Text("Highscores:", self.color, self.font_size1)
-        self.text2 = LongText(f"• overall: {Data.highscore} \n " + " \n ".join([f"• {k}: {v}" for k, v in Data.highscores_speed.items()]), self.color, self.font_size2, line_spacing=6)
+        self.text2 = LongText(f"• overall: {History.highscore()} \n " + " \n ".join([f"• {speed}: {History.highscore(speed)}" for speed in sorted(conf.speed_list)]), self.color, self.font_size2, line_spacing=6)
         self.y2 = conf.margin + self.text1.height
 
     def draw(self):
@@ -538,8 +1246,9 @@ class TotalStatsInMenuClass:
         self.y2 = self.y1 + self.text_games.height + 5
 
     def update(self):
-        self.text_games = Text(f"total games: {Data.total_games}", self.color, self.font_size)
-        self.text_time = Text(f"total time: {format_time(Data.total_time)}", self.color, self.font_size)
+        MenuScreen.invalidate()
+        self.text_games = Text(f"total games: {History.total_games()}", self.color, self.font_size)
+        self.text_time = Text(f"total time: {format_time(History.total_time())}", self.color, self.font_size)
 
     def draw(self):
         self.text_games.draw(self.x, self.y1)
@@ -561,7 +1270,9 @@ class VolumeWidgetInMenuClass:
         self.button_plus = Button(self.x_button_plus, self.y_buttons, self.button_dim, self.button_dim, "+", self.font_size, command=VolumeWidgetInMenuClass.increase)
 
     def update(self):
-        pygame.mixer.music.set_volume(Data.volume)
+        MenuScreen.invalidate()
+        if pygame.mixer.get_init():
+            pygame.mixer.music.set_volume(Data.volume)
         self.text = Text(f"Volume: {Data.volume:.0%}", conf.color_font, self.font_size)
         self.x_text = conf.window_width - conf.margin - 2 * (self.spacing + self.button_dim) - self.text.width
 
@@ -591,6 +1302,37 @@ class VolumeWidgetInMenuClass:
 
 ########### Scenes managing ###########
 
+def wait_events(timeout=None):
+    """
+    Sleeps until there is an event or the timeout (in ms) passes, returns all pending events.
+    Used by static scenes, which redraw only after input instead of every frame.
+    Without window focus it wakes up less often and limits the frame rate further.
+    """
+    global window_focused
+    if timeout is None:
+        timeout = conf.idle_timeout if window_focused else conf.idle_timeout_unfocused
+    clock.tick(conf.fps if window_focused else conf.fps_unfocused)
+
+    events = [pygame.event.wait(timeout)]
+    events.extend(pygame.event.get())
+    events = [event for event in events if event.type != pygame.NOEVENT]
+    for event in events:
+        if event.type == pygame.WINDOWFOCUSLOST:
+            window_focused = False
+        elif event.type == pygame.WINDOWFOCUSGAINED:
+            window_focused = True
+    return events
+
+
+def wait_keys_released():
+    """Waits until Space and Escape are released, so that a key still held at the end of a scene does nothing in the menu."""
+    while True:
+        keys = pygame.key.get_pressed()
+        if not (keys[pygame.K_SPACE] or keys[pygame.K_ESCAPE]):
+            break
+        wait_events()
+
+
 def menu_main():
     global mouse
     global menu
@@ -603,21 +1345,35 @@ def menu_main():
     creditss = False
 
     LastScore = None
+    mouse = pygame.mouse.get_pos()
+    menu_redraw()
+    init_deferred()
     while menu:
-        clock.tick(conf.fps)
+        Profiler.start_frame("menu")
+        events = wait_events()
+        Profiler.mark("wait", idle=True)
+        redraw = bool(events)
+        replay = False
 
         mouse = pygame.mouse.get_pos()
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 menu = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_r and LastReplay:
+                replay = True
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                ProfilerOverlay.toggle()
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                ButtonPlay.click()     # Game
+                for button in MenuScreen.game_buttons():  # Game
+                    button.click()
                 ButtonExit.click()     # Exit
                 WebsiteButton.click()  # Website
                 CreditsButton.click()  # Credits
+                AutopilotButton.click()
                 SpeedButtons.click()   # Speed buttons
                 VolumeWidgetInMenu.button_minus.click()
                 VolumeWidgetInMenu.button_plus.click()
+        Profiler.mark("events")
 
         keys = pygame.key.get_pressed()
         if keys[pygame.K_ESCAPE]:
@@ -631,33 +1387,56 @@ def menu_main():
             SpeedButtons.await_increase()
         else:
             SpeedButtons.change_speed()
+        Profiler.mark("keys")
 
         if game:
             game_main()
+            MenuScreen.invalidate()  # last score, statistics, saved game
+            redraw = True
+        if replay:
+            replay_main(LastReplay, conf.replay_speed)
+            redraw = True
         if creditss:
             creditss_main()
+            redraw = True
 
-        menu_redraw()
+        if redraw and menu:
+            menu_redraw()
 
 
 def menu_redraw():
-    global LastScore
-    window.fill(conf.color_window_background)
-    SnakeLogo.draw((conf.window_width - SnakeLogo.width) // 2, 4.5 * conf.grid)
-    HighscoresInMenu.draw()
-    TotalStatsInMenu.draw()
-    if LastScore:
-        LastScore.draw((conf.window_width - LastScore.width) // 2, 205)
-    ButtonPlay.draw()
-    ButtonExit.draw()
-    Author.draw(conf.window_width - conf.margin - Author.width, conf.window_height - conf.margin - Author.height)
-    WebsiteButton.draw()
-    CreditsButton.draw()
-    SpeedText.draw(conf.window_width - conf.margin - SpeedButtons.width_total - SpeedButtons.spacing - SpeedText.width, conf.margin + (SpeedButtons.height - SpeedText.height) // 2)
-    SpeedButtons.draw()
-    VolumeWidgetInMenu.draw()
+    MenuScreen.draw()
+    ProfilerOverlay.draw()
 
+    Profiler.mark("draw")
     pygame.display.update()
+    Profiler.mark("flip")
+    StartupTimeline.finish()
+
+
+def init_deferred():
+    """Initializes the subsystems that the first frame of the menu does not need, after it is shown."""
+    global joystick
+    pygame.mixer.init()
+    pygame.mixer.music.set_volume(Data.volume)
+    pygame.joystick.init()
+    joystick = pygame.joystick.Joystick(0) if pygame.joystick.get_count() else False
+
+
+def open_website():
+    import webbrowser  # only needed on click, it imports a lot on some systems
+    webbrowser.open(conf.url_website, new=0, autoraise=True)
+
+
+def board_size(text):
+    """Argument type of the --board option, COLSxROWS, not smaller than the game area."""
+    try:
+        cols, rows = map(int, text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected COLSxROWS, got {text!r}")
+    if not (conf.board_cols <= cols <= conf.board_max and conf.board_rows <= rows <= conf.board_max):
+        raise argparse.ArgumentTypeError(f"board must be from {conf.board_cols}x{conf.board_rows} to {conf.board_max}x{conf.board_max} cells")
+    return cols, rows
 
 
 def game_main():
@@ -665,75 +1444,119 @@ def game_main():
     global game
     pygame.mixer.music.load(conf.path_music_Game)
     pygame.mixer.music.play(loops=-1)
-    Snake.reinit()
-    Apple.move()
-    Banana.move()
+    snapshot = SavedGame.load() if SavedGame.exists else None
+    if snapshot is not None:
+        logger.info(f"Resuming a saved game, score: {snapshot.engine.score} (speed: {snapshot.speed}, time: {format_time(max(snapshot.engine.ticks - 1, 0) / snapshot.speed, milliseconds=True)})")
+        if snapshot.speed != conf.speed:
+            conf.change_speed_to(snapshot.speed)
+    Snake.reinit(snapshot)
+    Snake.prerender()
+    TileSprites.prerender([Apple.color, Banana.color])
+    GameClock.reset()
+    Camera.center(Snake.engine.head)
+    dirty = conf.dirty_rendering and not Camera.scrolling  # the board of GameScreen does not scroll
     game_notOver = True
+    leaving = False  # Escape or closing the window, a started game is saved
+    if conf.interpolation:
+        game_redraw(alpha=0)
+    elif dirty:
+        GameScreen.draw_full()
+    else:
+        game_redraw()
 
     while game_notOver:
+        Profiler.start_frame("game", 1 / conf.fps)
         clock.tick(conf.fps)
-
-        if Snake.fpsCounter % conf.move_delay == 0:
-            game_redraw()
-        if Snake.dirx or Snake.diry:  # snake started moving
-            Snake.fpsCounter += 1
-            Banana.lifetime -= 1
-            if Banana.lifetime == 0:
-                Banana.move()
+        Profiler.mark("sleep", idle=True)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 game_notOver = False
+                leaving = True
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                ProfilerOverlay.toggle()
+                if dirty and not conf.interpolation:  # repaint the whole board, without the overlay or with a new one
+                    GameScreen.draw_full()
+                elif not conf.interpolation:
+                    game_redraw()
+            elif event.type == pygame.KEYDOWN and event.key in conf.keys_turn:
+                Snake.turn(conf.keys_turn[event.key])
             elif joystick and event.type == pygame.JOYAXISMOTION:
                 if joystick.get_axis(3) < -conf.joystick_sensitivity:  # ← -x
-                    Snake.change_dir_left()
+                    Snake.turn(LEFT)
                 elif joystick.get_axis(3) > conf.joystick_sensitivity:  # → +x
-                    Snake.change_dir_right()
+                    Snake.turn(RIGHT)
                 elif joystick.get_axis(4) < -conf.joystick_sensitivity:  # ↑ -y
-                    Snake.change_dir_up()
+                    Snake.turn(UP)
                 elif joystick.get_axis(4) > conf.joystick_sensitivity:  # ↓ +y
-                    Snake.change_dir_down()
+                    Snake.turn(DOWN)
+        Profiler.mark("events")
 
         keys = pygame.key.get_pressed()
         if keys[pygame.K_ESCAPE]:
             game_notOver = False
+            leaving = True
+        Profiler.mark("keys")
+        if leaving:
+            break
 
-        if keys[pygame.K_LEFT] or keys[pygame.K_a]:  # ← -x
-            Snake.change_dir_left()
-        elif keys[pygame.K_RIGHT] or keys[pygame.K_d]:  # → +x
-            Snake.change_dir_right()
-        elif keys[pygame.K_UP] or keys[pygame.K_w]:  # ↑ -y
-            Snake.change_dir_up()
-        elif keys[pygame.K_DOWN] or keys[pygame.K_s]:  # ↓ +y
-            Snake.change_dir_down()
-
-        if Snake.fpsCounter % conf.move_delay == 0:
+        moves = GameClock.update(not Snake.paused and (Snake.dirx or Snake.diry or Snake.autopilot is not None))
+        for _ in range(moves):
+            if Snake.autopilot is not None:
+                Snake.steer()
+                Profiler.mark("plan")
             Snake.move()
+            if not game_notOver:
+                break
+        Profiler.mark("move")
+        if not game_notOver:
+            break
 
-    logger.info(f"Game over, score: {Snake.score} (speed: {conf.speed}, time: {format_time(Snake.fpsCounter / conf.fps, milliseconds=True)})")
+        if conf.interpolation:
+            game_redraw(alpha=GameClock.alpha())
+        elif moves:
+            if dirty:
+                GameScreen.redraw()
+            else:
+                game_redraw()
+        Snake.turns_shown()
+    Profiler.end_scene()
+
+    if leaving and Snake.engine.ticks and Snake.autopilot is None:  # games of the autopilot are not worth resuming
+        logger.info(f"Game left, score: {Snake.score} (speed: {conf.speed}, time: {format_time(Snake.time, milliseconds=True)}), saving it")
+        SavedGame.save(Snake.take_snapshot())
+        pygame.mixer.music.stop()
+        wait_keys_released()
+        game = False
+        return
+
+    logger.info(f"Game over, score: {Snake.score} (speed: {conf.speed}, time: {format_time(Snake.time, milliseconds=True)})")
+    if Snake.engine.won:
+        logger.info("Board filled up, game won")
+    logger.debug(f"Turns: {Snake.turn_queue.queued} queued, {Snake.turn_queue.dropped} dropped")
     pygame.mixer.music.pause()
     pygame.mixer.music.load(conf.path_music_GameOver)
     pygame.mixer.music.play()
 
-    Data.total_games += 1
-    Data.total_time += Snake.fpsCounter / conf.fps
-    TotalStatsInMenu.update()
-    # new record
-    if Snake.score > Data.highscores_speed[(speed_str := str(conf.speed))]:
-        logger.info(f"Highscore beaten, old: {Data.highscores_speed[speed_str]}, new: {Snake.score} (speed {conf.speed})")
-        Data.highscores_speed[speed_str] = Snake.score
-        if Snake.score > Data.highscore:
-            Data.highscore = Snake.score
-        NewHighscoreText = Text(f"new highscore: {Snake.score} (speed {conf.speed})", conf.color_newhighscore, conf.font_size_newhighscore)
-        NewHighscoreText.draw((conf.window_width - NewHighscoreText.width) // 2, (conf.window_height - GameOver.height) // 2 - GameOver.height + NewHighscoreText.height - 10)
-        HighscoresInMenu.update()
-    elif Snake.score > Data.highscore:
-        logger.info(f"Highscore beaten, old: {Data.highscore}, new: {Snake.score} (speed {conf.speed})")
-        Data.highscore = Snake.score
-        NewHighscoreText = Text(f"new highscore: {Snake.score}", conf.color_newhighscore, conf.font_size_newhighscore)
-        NewHighscoreText.draw((conf.window_width - NewHighscoreText.width) // 2, (conf.window_height - GameOver.height) // 2 - GameOver.height + NewHighscoreText.height - 10)
-        HighscoresInMenu.update()
-    Data.write()
+    Snake.save_replay()
+    if Snake.autopilot is not None:
+        logger.info("Game of the autopilot, not counted in statistics and highscores")
+    else:
+        highscore_speed = History.highscore(conf.speed)
+        highscore = History.highscore()
+        History.append(GameRecord(time.time(), conf.speed, Snake.score, Snake.time, Snake.engine.apples, Snake.engine.bananas, Snake.engine.cause or QUIT))
+        TotalStatsInMenu.update()
+        # new record
+        if Snake.score > highscore_speed:
+            logger.info(f"Highscore beaten, old: {highscore_speed}, new: {Snake.score} (speed {conf.speed})")
+            NewHighscoreText = Text(f"new highscore: {Snake.score} (speed {conf.speed})", conf.color_newhighscore, conf.font_size_newhighscore)
+            NewHighscoreText.draw((conf.window_width - NewHighscoreText.width) // 2, (conf.window_height - GameOver.height) // 2 - GameOver.height + NewHighscoreText.height - 10)
+            HighscoresInMenu.update()
+        elif Snake.score > highscore:
+            logger.info(f"Highscore beaten, old: {highscore}, new: {Snake.score} (speed {conf.speed})")
+            NewHighscoreText = Text(f"new highscore: {Snake.score}", conf.color_newhighscore, conf.font_size_newhighscore)
+            NewHighscoreText.draw((conf.window_width - NewHighscoreText.width) // 2, (conf.window_height - GameOver.height) // 2 - GameOver.height + NewHighscoreText.height - 10)
+            HighscoresInMenu.update()
 
     global LastScore
     LastScore = Text(f"last score: {Snake.score}", conf.color_font, conf.font_size_lastscore)
@@ -743,44 +1566,80 @@ def game_main():
     game = False
 
 
-def game_redraw():
+def replay_main(replay, multiplier):
+    """Shows the replay of a game at multiplier × its speed, Escape stops it."""
+    logger.info(f"Playing replay, {replay.ticks} moves at speed {replay.speed}")
+    replay.start(Snake.engine)
+    Snake.speed = replay.speed
+    GameClock.reset(replay.speed * multiplier)
+    Camera.center(Snake.engine.head)
+    dirty = not Camera.scrolling
+    if dirty:
+        GameScreen.draw_full()
+    else:
+        game_redraw()
+
+    playing = True
+    while playing:
+        Profiler.start_frame("replay", 1 / conf.fps)
+        clock.tick(conf.fps)
+        Profiler.mark("sleep", idle=True)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                playing = False
+        Profiler.mark("events")
+
+        moves = GameClock.update(True)
+        try:
+            for _ in range(moves):
+                if not replay.step(Snake.engine):
+                    playing = False
+                    break
+        except ReplayDivergence as err:
+            logger.warning(f"Replay stopped: {err}")
+            playing = False
+        Profiler.mark("move")
+        if moves:
+            if dirty:
+                GameScreen.redraw()
+            else:
+                game_redraw()
+    Profiler.end_scene()
+
+
+def game_redraw(alpha=None):
+    Camera.follow(Snake.engine.head)
     window.fill(conf.color_window_background)
     pygame.draw.rect(window, conf.color_game_background, (conf.game_x, conf.game_y, conf.game_width, conf.game_height))
-    Snake.draw()
+    Snake.draw(alpha)
     Apple.draw()
     Banana.draw()
     TopBar.draw()
     CurrentSpeedText.draw()
+    ProfilerOverlay.draw()
+    Profiler.mark("draw")
     pygame.display.update()
+    Profiler.mark("flip")
 
 
 def gameover_main():
-    GameOver.draw((conf.window_width - GameOver.width) // 2, (conf.window_height - GameOver.height) // 2)
+    Result = YouWon if Snake.engine.won else GameOver
+    Result.draw((conf.window_width - Result.width) // 2, (conf.window_height - Result.height) // 2)
+    pygame.display.update()
     show_gameOver = True
     if joystick:
         joystick.rumble(0.2, 0.8, 500)
 
     while show_gameOver:
-        clock.tick(conf.fps)
-
-        for event in pygame.event.get():
+        for event in wait_events(conf.idle_poll_interval):  # the end of music has to be polled
             if event.type == pygame.QUIT:
                 show_gameOver = False
         keys = pygame.key.get_pressed()
         if not pygame.mixer.music.get_busy() or keys[pygame.K_SPACE] or keys[pygame.K_ESCAPE]:
             show_gameOver = False
 
-        pygame.display.update()
-
-    while True:  # wait for key to be released to avoid pressing it on menu
-        clock.tick(conf.fps)
-
-        pygame.event.get()
-        keys = pygame.key.get_pressed()
-        if not (keys[pygame.K_SPACE] or keys[pygame.K_ESCAPE]):
-            break
-
-        pygame.display.update()
+    wait_keys_released()
 
     pygame.mixer.music.pause()
     if joystick:
@@ -797,11 +1656,13 @@ def creditss_main():
     CreditsText = LongText("Icon: \n Icon made by Freepik from www.flaticon.com \n \n Music during gameplay: \n Tristan Lohengrin - Happy 8bit Loop 01 \n \n Sound after loss: \n Sad Trombone Wah Wah Wah Fail Sound Effect", conf.color_font, conf.font_size_creditsscene, line_length=52)
     CreditsBackButton = Button((conf.window_width - conf.button_width) // 2, 500, conf.button_width, conf.button_height, "Back", conf.button_font_size, command=ButtonCmds.creditssFalse)
 
+    mouse = pygame.mouse.get_pos()
+    creditss_redraw()
     while creditss:
-        clock.tick(conf.fps)
+        events = wait_events()
 
         mouse = pygame.mouse.get_pos()
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 creditss = False
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
@@ -811,7 +1672,8 @@ def creditss_main():
         if keys[pygame.K_ESCAPE]:
             creditss = False
 
-        creditss_redraw()
+        if events and creditss:
+            creditss_redraw()
 
 
 def creditss_redraw():
@@ -824,9 +1686,15 @@ def creditss_redraw():
 
 
 def loading_screen(function, loading_text, error_text, sysfont=False):
-    thread = MyThread(target=function, daemon=True)
+    def task():
+        try:
+            function()
+        finally:
+            pygame.event.post(pygame.event.Event(conf.event_loading_done))  # wakes up the loop below
+
+    thread = MyThread(target=task, daemon=True)
     thread.start()
-    time = 0
+    start = time.perf_counter()
     LoadingTexts = (
         Text(loading_text, conf.color_font, conf.font_size_loading, sysfont=sysfont),
         Text(f"{loading_text}.", conf.color_font, conf.font_size_loading, sysfont=sysfont),
@@ -834,13 +1702,16 @@ def loading_screen(function, loading_text, error_text, sysfont=False):
         Text(f"{loading_text}...", conf.color_font, conf.font_size_loading, sysfont=sysfont)
     )
 
+    shown = None
     while thread.is_alive():
-        clock.tick(conf.fps)
-        window.fill(conf.color_window_background)
-        Loading = LoadingTexts[time // conf.fps % 4]
-        Loading.draw((conf.window_width - Loading.width) / 2, (conf.window_height - Loading.height) / 2)
-        pygame.display.update()
-        time += 1
+        elapsed = time.perf_counter() - start
+        if (dots := int(elapsed) % 4) != shown:  # one more dot every second
+            shown = dots
+            window.fill(conf.color_window_background)
+            Loading = LoadingTexts[dots]
+            Loading.draw((conf.window_width - Loading.width) / 2, (conf.window_height - Loading.height) / 2)
+            pygame.display.update()
+        wait_events(int((1 - elapsed % 1) * 1000) + 1)
 
     if thread.error:
         logger.error(thread.error)
@@ -856,11 +1727,19 @@ def error_screen(text):
     ErrorText = LongText(text, conf.color_font, conf.font_size_error)
     ButtonExit2 = Button((conf.window_width - conf.button_width) // 2, 500, conf.button_width, conf.button_height, "Exit", conf.button_font_size, command=lambda: sys.exit(1))
 
+    def redraw():
+        window.fill(conf.color_error_background)
+        ErrorText.draw((conf.window_width - ErrorText.width) / 2, (conf.window_height - ErrorText.height) / 2 - 60)
+        ButtonExit2.draw()
+        pygame.display.update()
+
+    mouse = pygame.mouse.get_pos()
+    redraw()
     while error:
-        clock.tick(conf.fps)
+        events = wait_events()
 
         mouse = pygame.mouse.get_pos()
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 error = False
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
@@ -870,10 +1749,8 @@ def error_screen(text):
         if keys[pygame.K_ESCAPE]:
             error = False
 
-        window.fill(conf.color_error_background)
-        ErrorText.draw((conf.window_width - ErrorText.width) / 2, (conf.window_height - ErrorText.height) / 2 - 60)
-        ButtonExit2.draw()
-        pygame.display.update()
+        if events and error:
+            redraw()
 
 
 ####### Settings / Config #######
@@ -882,8 +1759,8 @@ class conf:
     version = "1.6.0"
     grid = 25
     grid_border = 2
-    window_width = grid * 33
-    window_height = grid * 26
+    window_width = grid * (COLS + 2)
+    window_height = grid * (ROWS + 3)
     margin = 12
     topbar_width = window_width
     topbar_height = 2 * grid
@@ -911,6 +1788,8 @@ class conf:
     button_width = grid * 10
     button_height = grid * 4
     button_font_size = 35
+    button_pair_width = grid * 7  # Resume and New game side by side, clear of the total stats on the left
+    button_pair_font_size = 30
 
     ButtonPlay_y = 275
     ButtonExit_y = 420
@@ -921,43 +1800,90 @@ class conf:
         path_gameDir = MyPath.home() / ".snake"  # ~/.snake/
     path_data = path_gameDir / "data"  # ~/.snake/data
     path_data_backup = path_gameDir / "data.backup"  # ~/.snake/data.backup
-    path_version = path_gameDir / "version"  # ~/.snake/version
+    data_write_delay = 1  # seconds of no changes after which the game data is written
+    path_version_old = path_gameDir / "version"  # ~/.snake/version, only up to v1.6.0
+    path_history = path_gameDir / "history"  # ~/.snake/history, record of every game
+    path_history_index = path_gameDir / "history.idx"  # ~/.snake/history.idx, statistics of the history
     path_assetsDir = path_gameDir / "assets"  # ~/.snake/assets/
     path_font = path_assetsDir / "OpenSans-Bold.ttf"
     path_music_Game = path_assetsDir / "Tristan Lohengrin - Happy 8bit Loop 01.ogg"
     path_music_GameOver = path_assetsDir / "Sad Trombone Wah Wah Wah Fail Sound Effect.ogg"
     path_icon = path_assetsDir / "icon.png"
     path_logDir = path_gameDir / "logs"  # ~/.snake/logs/
-    path_log1 = path_logDir / "1.log"
-    path_log2 = path_logDir / "2.log"
-    path_log3 = path_logDir / "3.log"
-    path_log4 = path_logDir / "4.log"
+    path_replayDir = path_gameDir / "replays"  # ~/.snake/replays/
+    path_save = path_gameDir / "save"  # ~/.snake/save, game left with Escape, see SavedGameClass
+    path_profileDir = path_logDir / "profile"  # ~/.snake/logs/profile/, frame time histograms of the last session with profiling
+    path_log1 = path_logDir / "1.log"  # older logs are 2.log.gz, 3.log.gz…
+    log_max_bytes = 1_000_000  # of 1.log, it is rotated when bigger
+    log_backups = 3
+    log_queue_size = 10_000  # records waiting to be written, see LogQueueHandler
 
     url_font = "https://cdn.discordapp.com/attachments/854111213709557821/956506488115974164/OpenSans-Bold.ttf"
     url_music_Game = "https://cdn.discordapp.com/attachments/854111213709557821/956506487579095070/Tristan_Lohengrin_-_Happy_8bit_Loop_01.ogg"
     url_music_GameOver = "https://cdn.discordapp.com/attachments/854111213709557821/956506487902068746/Sad_Trombone_Wah_Wah_Wah_Fail_Sound_Effect.ogg"
     url_website = "http://tiny.cc/snake_website"
+    assets = [  # checked and downloaded by checkFiles
+        Asset(path_font.name, url_font, 104120, "f7916a37377e38527d4306303cfe89b653b49b0a6b0b05c6b7593f7ab0248da8"),
+        Asset(path_music_Game.name, url_music_Game, 466096, "5c9a3a339fc5a52ee6fa5a7d110c7327391103fddf8dc2a5291f449320592da4"),
+        Asset(path_music_GameOver.name, url_music_GameOver, 36523, "9663f9ae82de516815ef798fb266231905a046e6dce7efd4f3e883b95c534234"),
+    ]
 
     icon_content = "iVBORw0KGgoAAAANSUhEUgAAADAAAAAwCAMAAABg3Am1AAABR1BMVEUAAABeswAAgABrygBnuwBrygBowQBnvAAAbwFnvgDlNBdrywBpwADuORRtvQBrzgAAgABnvQABcAFovgBsygBrygBrygBowQAAcwBqwwBqxQAAfgBpxwBxzgALdwFfwQALhwBcvwAAbQFnvgAxogBrygBnvgAFgwBovwBsywAnkABpxgAAcgAAcQBsygAAcgBrygA7nQBryABowQAAgAB6rAMAbQEAbAEokABrygAXjwBovQBmxwBrygADgQA0pQBwtwFnxgAAgAAAbwFBrQBovwBrygBovwBrygBqwAAAcQAAgABqygAAcQBovwA8pAAPgABrywAAdQBqzAAAgABrywAvoQAAgQBGsQAAcgAdlgAAdQAnlgBXrwBpwwBnugBrygAAgAAAaQExogDeLBsWgAE8qQBdtQA5qABnuwBSrAB7qARZsgAJeIArAAAAX3RSTlMABOLg/fpo+uLi28yjWRsU+Pbr3dXBh35dVU8+OQz8/Pz39PDv59nUwLSlkpKIZ2dINCwhFPn59/Lw7ezq6enm5d3c09HQxMS6tbSrqKWMiXh1dHNsYlxXRUM9MCcjEayMVDsAAAHASURBVEjH1dVnUwIxEAbgnByCYgERFMHeBREBe++993rhxAL4/z/LJbckJ8lMZnSc8f3Ezu5zQzbcgFRSn883wud/CZobtqZKpdWRWsX5iG7YCWoq850eo5I9FdBmsHhUwIjBJaMAhngQUQALPGhTAB4eNHzvPqdvr++ziE+BBzuOVsfhHMZvuVzOf3BT2XiTwSeIWGI+jLEFSIaj8BQH6GfzV24MgMR/ya5BdBERjAFAjkgj7gA6zKfd1cBstzq1DhAAsIsFoM/qaAHRWmNYBMxzcmqdzQ/B8sJisEEX2199bT4Yd29vzg/7AUzTbh0A9gYNAkhZVRSAKQWwoyVargPIysCLnQFarnxYKRaLj6ScfbVzUgFwzh5a9mIr5UdOkrLLtDP2c7BMyzUAT6RsAXBaBWpo2QqgiZReABO/BnwAYs6v1C4DowDqMghpCRPyIANxAEah8GmyaDKQooDknc17kQxog0IwLgUoKQJ9SA60EA/YjkQ/PppmVxVIIC7YTjeqiBAAdgAxgGgXOge8USQEi46/tuNgQC/fw0zL/h1CYuBCkvw9cNkgpArCNkiqgk76BoxqSFmEXe7WM7X5L+xVXXt8wCY7AAAAAElFTkSuQmCC"
 
-    fps = 120
-    speed = 10  # default speed (aka movesPerSecond) (fps divisor)
-    speed_list = [5, 10, 15, 30, 60]
-    move_delay = fps // speed
+    fps = 120  # rendering limit, the game logic runs at its own rate, see GameClockClass
+    speed = 10  # default speed (aka movesPerSecond)
+    speed_list = list(SPEEDS)
+    interpolation = False  # redraw every frame and slide the head between cells
+    autopilot = False  # the snake is played by Autopilot, toggled in the menu or by the --autopilot option
+
+    # Static scenes (menu, credits, game over, loading, error) sleep until input, see wait_events()
+    idle_timeout = 1000  # ms
+    idle_timeout_unfocused = 5000  # ms
+    idle_poll_interval = 100  # ms, for things without events, like the end of music
+    fps_unfocused = 10
+
+    profiler_overlay_interval = 0.5  # seconds between updates of the numbers
+
+    replays_keep = 50
+    replay_speed = 2  # multiplier of the speed of the game when watching its replay (R in menu)
+    event_loading_done = pygame.USEREVENT
 
     @classmethod
     def change_speed_to(cls, s):
         cls.speed = s
-        cls.move_delay = cls.fps / cls.speed
         logger.info(f"Changed speed to {s}")
+        MenuScreen.invalidate()
         Data.write()
         CurrentSpeedText.update()
 
     joystick_sensitivity = 0.91
+    keys_turn = {
+        pygame.K_LEFT: LEFT, pygame.K_a: LEFT,
+        pygame.K_RIGHT: RIGHT, pygame.K_d: RIGHT,
+        pygame.K_UP: UP, pygame.K_w: UP,
+        pygame.K_DOWN: DOWN, pygame.K_s: DOWN,
+    }
+    input_queue_depth = 3  # turns waiting for the next moves, further ones are dropped, see TurnQueue
+
+    dirty_rendering = True  # repaint only changed parts of the game scene, see GameScreenClass, not used on boards that scroll
+
+    board_cols = COLS  # cells, bigger boards than the game area scroll with the head (--board option)
+    board_rows = ROWS
+    board_max = BOARD_MAX
+    camera_margin = 6  # cells kept in view ahead of the head on boards that scroll
 
 
 ############# Main code #############
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snake game")
+    parser.add_argument("--profile", action="store_true", help="time the phases of frames and show them (F3 toggles it in the game)")
+    parser.add_argument("--board", type=board_size, metavar="COLSxROWS", help=f"size of the board in cells (default {conf.board_cols}x{conf.board_rows}), bigger boards scroll")
+    parser.add_argument("--autopilot", action="store_true", help="let the autopilot play (can be toggled in the menu)")
+    args = parser.parse_args()
+    conf.autopilot = args.autopilot
+    if args.board:
+        conf.board_cols, conf.board_rows = args.board
+
     #### Initializing game data ####
     # moved from checkFiles() to make sure there is a game directory, so that the log file can be put there and game icon set
     if not conf.path_gameDir.exists():
@@ -966,77 +1892,113 @@ if __name__ == "__main__":
         conf.path_logDir.mkdir()
     if not conf.path_assetsDir.exists():
         conf.path_assetsDir.mkdir()
+    if not conf.path_replayDir.exists():
+        conf.path_replayDir.mkdir()
 
     if not conf.path_icon.exists():
         conf.path_icon.write_bytes(base64.b64decode(conf.icon_content))
 
-    #### Logging configuration ####
-    if conf.path_log4.exists():
-        conf.path_log4.unlink()
-    if conf.path_log3.exists():
-        conf.path_log3.replace(conf.path_log4)
-    if conf.path_log2.exists():
-        conf.path_log2.replace(conf.path_log3)
-    if conf.path_log1.exists():
-        conf.path_log1.replace(conf.path_log2)
+    StartupTimeline = StartupTimelineClass(startup_start)
+    StartupTimeline.mark("imports")
 
-    sys.stderr = Tee(sys.stderr, conf.path_log1, "a")
+    #### Logging configuration ####
+    for path in conf.path_logDir.glob("[2-9].log"):  # uncompressed logs of older versions
+        path.unlink()
 
     for handler in logging.root.handlers[:]:  # this is needed in PyCharm and can be left for safety
         logging.root.removeHandler(handler)
 
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
-    formatter = logging.Formatter("%(asctime)s [%(levelname)s] (Line %(lineno)d in %(funcName)s) - %(message)s")
-    file_handler = logging.FileHandler(filename=conf.path_log1, mode="a")
+    formatter = LogFormatter("%(asctime)s [%(levelname)s] (Line %(lineno)d in %(funcName)s) - %(message)s")
+    file_handler = LogFileHandler(conf.path_log1, conf.log_max_bytes, conf.log_backups)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
     stdout_handler = logging.StreamHandler(sys.stdout)
     stdout_handler.setLevel(logging.INFO)
-    logger.addHandler(stdout_handler)
+    stdout_handler.addFilter(lambda record: record.name != "stderr")  # already in the terminal
+    queue_handler = LogQueueHandler(conf.log_queue_size)
+    logger.addHandler(queue_handler)
+    log_listener = LogQueueListener(queue_handler.queue, file_handler, stdout_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # also after an uncaught exception, whose traceback is logged through Tee
+
+    sys.stderr = Tee(sys.stderr)
 
     #### Main game code ####
     logger.info(f"Starting Snake v{conf.version}")
     logger.info(f"System: {platform.system()}, version: {platform.release()}")
+    StartupTimeline.mark("logging")
     pygame.display.init()
-    pygame.mixer.init()
     pygame.font.init()
-    pygame.joystick.init()
-    joystick = pygame.joystick.Joystick(0) if pygame.joystick.get_count() else False
+    joystick = False  # mixer and joystick are initialized after the first frame, see init_deferred()
     clock = pygame.time.Clock()
+    window_focused = True
     window = pygame.display.set_mode((conf.window_width, conf.window_height), vsync=1)
     pygame.display.set_caption(f"Snake v{conf.version}")
     pygame.display.set_icon(pygame.image.load(conf.path_icon))
+    TextCache = TextCacheClass()
+    TileSprites = TileSpritesClass()
+    StartupTimeline.mark("window")
 
     loading_screen(checkFiles, "Loading", "Program encountered a problem while creating local files. Check Your Internet connection and try again.", sysfont=not conf.path_font.is_good())
+    StartupTimeline.mark("files")
     Data = File()
     Data.read()
+    SavedGame = SavedGameClass()
+    History = GameHistory(conf.path_history, conf.path_history_index)
+    # statistics continue those gathered before the history existed
+    History.open(base={"games": Data.datadict.get("total_games", 0), "time": Data.datadict.get("total_time", 0.0),
+                       "highscore": Data.datadict.get("highscore", 0), "highscores_speed": dict(Data.datadict.get("highscores_speed", {}))})
+    StartupTimeline.mark("data")
 
     # Prerendered objects
     GameOver = Text("GAME  OVER", (255, 0, 0), 77)
+    YouWon = Text("YOU  WON", (255, 215, 0), 77)
     SnakeLogo = Text("Snake Game", (255, 255, 255), 62)
     Author = Text("Michał Machnikowski 2023", (215, 215, 215), 21)
 
     ButtonPlay = Button((conf.window_width - conf.button_width) // 2, conf.ButtonPlay_y, conf.button_width, conf.button_height, "Play", conf.button_font_size, command=ButtonCmds.gameTrue)
+    ButtonResume = Button((conf.window_width - conf.grid) // 2 - conf.button_pair_width, conf.ButtonPlay_y, conf.button_pair_width, conf.button_height, "Resume", conf.button_pair_font_size, command=ButtonCmds.gameTrue)
+    ButtonNewGame = Button((conf.window_width + conf.grid) // 2, conf.ButtonPlay_y, conf.button_pair_width, conf.button_height, "New game", conf.button_pair_font_size, command=ButtonCmds.newGame)
     ButtonExit = Button((conf.window_width - conf.button_width) // 2, conf.ButtonExit_y, conf.button_width, conf.button_height, "Exit", conf.button_font_size, command=ButtonCmds.menuFalse)
-    WebsiteButton = Button(conf.margin, conf.window_height - conf.margin - 2 * conf.grid, int(4.85 * conf.grid), 2 * conf.grid, "website", conf.font_size_website, command=lambda: webbrowser.open(conf.url_website, new=0, autoraise=True), radius=7)
+    WebsiteButton = Button(conf.margin, conf.window_height - conf.margin - 2 * conf.grid, int(4.85 * conf.grid), 2 * conf.grid, "website", conf.font_size_website, command=open_website, radius=7)
     CreditsButton = Button(conf.margin + int(5.5 * conf.grid), conf.window_height - conf.margin - 2 * conf.grid, int(4.65 * conf.grid), 2 * conf.grid, "credits", conf.font_size_website, command=ButtonCmds.creditssTrue, radius=7)
+    AutopilotButton = ButtonAutopilot(conf.margin + int(10.8 * conf.grid), conf.window_height - conf.margin - 2 * conf.grid, int(5.6 * conf.grid), 2 * conf.grid, "autopilot", conf.font_size_website, command=ButtonCmds.autopilotToggle, radius=7)
 
+    MenuScreen = MenuScreenClass()
     SpeedText = Text("Speed:", conf.color_font, 22)
     SpeedButtons = ButtonSpeedGroup()
     HighscoresInMenu = HighscoresInMenuClass()
     TotalStatsInMenu = TotalStatsInMenuClass()
     VolumeWidgetInMenu = VolumeWidgetInMenuClass()
 
-    Snake = SnakeClass()
     Apple = AppleClass()
     Banana = BananaClass()
+    Snake = SnakeClass()
+    Camera = CameraClass()
+    LastReplay = None
     TopBar = TopBarClass()
+    GameScreen = GameScreenClass()
+    GameClock = GameClockClass()
     CurrentSpeedText = CurrentSpeedTextClass()
+    Profiler = FrameProfiler()
+    ProfilerOverlay = ProfilerOverlayClass()
+    if args.profile:
+        ProfilerOverlay.toggle()
+    StartupTimeline.mark("widgets")
 
     menu_main()
 
     logger.info("Quitting")
+    try:
+        Data.flush()
+    except Exception:
+        logger.exception("Error while writing game data:")
+    SavedGame.wait()
+    History.close()
+    if Profiler.histograms:
+        logger.info(f"Frame time histograms written to {conf.path_profileDir} ({Profiler.dump(conf.path_profileDir)} files)")
     logger.debug(Data.dump_data())
+    logger.debug(f"Text cache: {TextCache.stats()}")
 
     pygame.quit()
@@ -0,0 +1,172 @@
+"""
+Snapshots of games in progress, for leaving a game and resuming it later, also in another session.
+A snapshot holds the whole state of a SnakeEngine, including its random generator and the permutation of free cells,
+so a restored game goes on exactly like the saved one would have, and the replay of the game goes on recording.
+The snake is stored as its tail cell followed by runs of moves towards the head, (length << 2 | direction) varints
+like the events of replays, so even a snake of 10 000 segments takes a few bytes if it does not wriggle. Runs are
+found by galloping along the body and checking only their ends, and restored with whole ranges of cells.
+The stored entries of the permutation, cells moved at some point of the game, are 32-bit positions followed by
+32-bit cell numbers: they are most of a snapshot of a long game, so they are packed and unpacked with one struct
+call each, and turned back into dicts by zip at C speed.
+"""
+
+from itertools import count, repeat
+import struct
+import zlib
+
+from engine import DIRECTIONS, SnakeEngine
+from replay import Replay, read_varint, write_varint
+
+MAGIC = b"SNSV"
+FORMAT_VERSION = 2  # 1 stored the permutation as (position, cell number) pairs
+HEADER = struct.Struct("<4sHII")  # magic, format version, payload length, CRC32 of payload
+# cols, rows, speed, banana lifetime, banana lifetime left, moves made, score, apples, bananas, free cells,
+# direction and current direction (index in DIRECTIONS, STOPPED if none)
+FIELDS = struct.Struct("<HHHIIIIIIIBB")
+RANDOM = struct.Struct("<625I?d")  # state of the Mersenne Twister, whether a gauss value is pending and the value
+STOPPED = len(DIRECTIONS)
+CODES = {direction: i for i, direction in enumerate(DIRECTIONS)}
+
+
+def direction_code(dx, dy):
+    return CODES.get((dx, dy), STOPPED)
+
+
+def body_runs(body):
+    """Runs of moves from the tail to the head, as (length, direction code)."""
+    cells = list(body)
+    last = len(cells) - 1
+    i = 0
+    while i < last:
+        x, y = cells[i]
+        nx, ny = cells[i + 1]
+        dx, dy = nx - x, ny - y
+        # k moves from cell i along the run end k cells away only if they all go straight, so whether cell i + k
+        # is there tells on which side of k the run ends
+        k, step = 1, 1
+        while i + k + step <= last and cells[i + k + step] == (x + (k + step) * dx, y + (k + step) * dy):
+            k += step
+            step *= 2
+        while step > 1:
+            step //= 2
+            if i + k + step <= last and cells[i + k + step] == (x + (k + step) * dx, y + (k + step) * dy):
+                k += step
+        yield k, CODES[dx, dy]
+        i += k
+
+
+def run_cells(x, y, dx, dy, length):
+    """Cells of a run of length moves from (x, y), without (x, y)."""
+    if dx:
+        return zip(range(x + dx, x + dx * (length + 1), dx), repeat(y, length))
+    return zip(repeat(x, length), range(y + dy, y + dy * (length + 1), dy))
+
+
+class Snapshot:
+    """
+    Game in progress: its engine, speed and replay. The snapshot takes the engine over, it must not be used by the game
+    anymore, so taking one copies nothing and encode() can run in another thread while the game goes on with a new engine.
+    """
+    def __init__(self, engine, speed, replay):
+        self.engine = engine
+        self.speed = speed
+        self.replay = replay
+
+    def encode(self):
+        engine = self.engine
+        cols = engine.cols
+        payload = bytearray(FIELDS.pack(cols, engine.rows, self.speed, engine.banana_lifetime, engine.banana_lifetime_left,
+                                        engine.ticks, engine.score, engine.apples, engine.bananas, engine.free_count,
+                                        direction_code(engine.dirx, engine.diry), direction_code(engine.dirx_current, engine.diry_current)))
+        version, internal, gauss = engine.random.getstate()
+        payload += RANDOM.pack(*internal, gauss is not None, gauss or 0.0)
+        for cell in (engine.apple, engine.banana):  # cell number + 1, 0 for none
+            write_varint(payload, 0 if cell is None else cell[1] * cols + cell[0] + 1)
+
+        x, y = engine.body[0]
+        write_varint(payload, y * cols + x)
+        runs = bytearray()
+        number = 0
+        for length, code in body_runs(engine.body):
+            write_varint(runs, length << 2 | code)
+            number += 1
+        write_varint(payload, number)
+        payload += runs
+
+        order = engine.order
+        write_varint(payload, len(order))
+        entries = struct.Struct(f"<{len(order)}I")
+        payload += entries.pack(*order.keys())
+        payload += entries.pack(*order.values())
+
+        replay = self.replay.encode()
+        write_varint(payload, len(replay))
+        payload += replay
+        return HEADER.pack(MAGIC, FORMAT_VERSION, len(payload), zlib.crc32(payload)) + payload
+
+    @classmethod
+    def decode(cls, content):
+        """Raises ValueError if the content is not a valid snapshot."""
+        if len(content) < HEADER.size:
+            raise ValueError("snapshot is truncated")
+        magic, format_version, length, checksum = HEADER.unpack_from(content)
+        if magic != MAGIC or format_version > FORMAT_VERSION:
+            raise ValueError("not a snapshot of a known format")
+        payload = content[HEADER.size:HEADER.size + length]
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            raise ValueError("checksum of the snapshot does not match")
+
+        try:
+            (cols, rows, speed, banana_lifetime, banana_lifetime_left, ticks, score, apples, bananas, free_count,
+             direction, direction_current) = FIELDS.unpack_from(payload)
+            engine = SnakeEngine(cols, rows, banana_lifetime=banana_lifetime)
+            *internal, has_gauss, gauss = RANDOM.unpack_from(payload, FIELDS.size)
+            engine.random.setstate((3, tuple(internal), gauss if has_gauss else None))
+            offset = FIELDS.size + RANDOM.size
+            fruits = []
+            for _ in range(2):
+                number, offset = read_varint(payload, offset)
+                fruits.append(None if number == 0 else ((number - 1) % cols, (number - 1) // cols))
+
+            number, offset = read_varint(payload, offset)
+            x, y = number % cols, number // cols
+            body = engine.body
+            body.clear()
+            body.append((x, y))
+            runs, offset = read_varint(payload, offset)
+            for _ in range(runs):
+                value, offset = read_varint(payload, offset)
+                dx, dy = DIRECTIONS[value & 3]
+                length = value >> 2
+                body.extend(run_cells(x, y, dx, dy, length))
+                x += dx * length
+                y += dy * length
+
+            entries, offset = read_varint(payload, offset)
+            if format_version == 1:
+                pairs = iter(struct.unpack_from(f"<{2 * entries}I", payload, offset))
+                positions, numbers = zip(*zip(pairs, pairs)) if entries else ((), ())
+            else:
+                positions = struct.unpack_from(f"<{entries}I", payload, offset)
+                numbers = struct.unpack_from(f"<{entries}I", payload, offset + 4 * entries)
+            offset += 8 * entries
+
+            length, offset = read_varint(payload, offset)
+            replay = Replay.decode(payload[offset:offset + length])
+        except (IndexError, KeyError, ValueError, struct.error) as err:
+            raise ValueError(f"snapshot is malformed: {err}")
+
+        engine.dirx, engine.diry = DIRECTIONS[direction] if direction != STOPPED else (0, 0)
+        engine.dirx_current, engine.diry_current = DIRECTIONS[direction_current] if direction_current != STOPPED else (0, 0)
+        engine.banana_lifetime_left = banana_lifetime_left
+        engine.ticks = ticks
+        engine.score = score
+        engine.apples = apples
+        engine.bananas = bananas
+        engine.apple, engine.banana = fruits
+        # every move enters one cell, so the cells from the head back were entered on the moves before
+        engine.occupied = dict(zip(body, count(ticks - len(body) + 1)))
+        engine.free_count = free_count
+        engine.order = dict(zip(positions, numbers))
+        engine.position = dict(zip(numbers, positions))
+        return cls(engine, speed, replay)
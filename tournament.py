@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tournament of bot policies, for tuning the difficulty of the game (speeds, banana lifetime) offline.
+Every policy plays the same seeded games at every speed, spread over all cores by a pool of worker processes
+that get chunks of games, so that sending work and results between processes costs little next to playing.
+Scores and survival times are reported per policy and speed (keys like Data.highscores_speed) as a table,
+and optionally as JSON and CSV.
+
+A policy is a function policy(engine, rng) returning a direction of engine.DIRECTIONS, or None to go on.
+Built-in ones are in POLICIES, others are given as module:function and must be importable by the workers.
+Run: python3 tournament.py [--policies greedy random mybots:hug] [--games 1000] [--speeds 5 10 …] [--json FILE] [--csv FILE]
+"""
+
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import importlib
+import json
+import os
+import random
+import statistics
+import time
+
+import autopilot
+from engine import SnakeEngine, SPEEDS, COLS, ROWS, BOARD_MAX, BANANA_SECONDS
+from profiler import percentile
+
+LIMIT = "moves limit"  # cause of games stopped by max_moves
+
+POLICIES = {}  # name: policy
+
+
+def policy(name):
+    def register(function):
+        POLICIES[name] = function
+        return function
+    return register
+
+
+@policy("random")
+def random_safe(engine, rng):
+    """Random direction that does not crash right away."""
+    safe = engine.safe_directions()
+    return rng.choice(safe) if safe else None
+
+
+@policy("greedy")
+def greedy(engine, rng):
+    """Safe direction closest to the apple, avoiding bananas when possible."""
+    safe = engine.safe_directions()
+    if not safe:
+        return None
+    x, y = engine.head
+    ax, ay = engine.apple
+    rng.shuffle(safe)  # random choice between equally good directions
+    return min(safe, key=lambda d: ((x + d[0], y + d[1]) == engine.banana, abs(x + d[0] - ax) + abs(y + d[1] - ay)))
+
+
+policy("autopilot")(autopilot.policy)
+
+
+def resolve(name):
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, function = name.partition(":")
+    if not function:
+        raise ValueError(f"unknown policy {name!r}, expected one of {', '.join(POLICIES)} or module:function")
+    return getattr(importlib.import_module(module), function)
+
+
+def play(function, cols, rows, speed, seed, banana_seconds, max_moves):
+    """Plays one game, returns (score, seconds survived, cause of the end)."""
+    engine = SnakeEngine(cols, rows, seed=seed, banana_lifetime=banana_seconds * speed)
+    rng = random.Random(seed)
+    while engine.ticks < max_moves:
+        if not engine.step(function(engine, rng)):
+            break
+    return engine.score, max(engine.ticks - 1, 0) / speed, engine.cause or LIMIT
+
+
+def play_chunk(task):
+    """Plays games with the seeds of a chunk, runs in the workers."""
+    name, cols, rows, speed, seeds, banana_seconds, max_moves = task
+    function = resolve(name)
+    return name, speed, [play(function, cols, rows, speed, seed, banana_seconds, max_moves) for seed in seeds]
+
+
+def chunks(args):
+    for name in args.policies:
+        for speed in args.speeds:
+            for start in range(0, args.games, args.chunk):
+                seeds = range(args.seed + start, args.seed + min(start + args.chunk, args.games))
+                yield name, args.cols, args.rows, speed, seeds, args.banana_seconds, args.max_moves
+
+
+def summary(values):
+    values = sorted(values)
+    return {"mean": statistics.fmean(values), "p50": percentile(values, 50), "p90": percentile(values, 90), "p99": percentile(values, 99), "max": values[-1]}
+
+
+def aggregate(results):
+    """{policy: {"highscores_speed": {speed: max score}, "speeds": {speed: statistics}}}, speeds as strings like in the game data."""
+    report = {}
+    for name, speeds in results.items():
+        report[name] = {"highscores_speed": {}, "speeds": {}}
+        for speed, games in speeds.items():
+            scores = [score for score, seconds, cause in games]
+            report[name]["highscores_speed"][str(speed)] = max(scores)
+            report[name]["speeds"][str(speed)] = {
+                "games": len(games),
+                "score": summary(scores),
+                "time": summary([seconds for score, seconds, cause in games]),
+                "causes": dict(Counter(cause for score, seconds, cause in games).most_common()),
+            }
+    return report
+
+
+def csv_rows(report):
+    yield ["policy", "speed", "games", *(f"{value}_{stat}" for value in ("score", "time") for stat in ("mean", "p50", "p90", "p99", "max")), "causes"]
+    for name, policy_report in report.items():
+        for speed, stats in policy_report["speeds"].items():
+            causes = "; ".join(f"{cause}: {count}" for cause, count in stats["causes"].items())
+            yield [name, speed, stats["games"], *(round(stats[value][stat], 3) for value in ("score", "time") for stat in ("mean", "p50", "p90", "p99", "max")), causes]
+
+
+def board_size(text):
+    """Argument type of the --board option, COLSxROWS, like the one of the game but also smaller than its board."""
+    try:
+        cols, rows = map(int, text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected COLSxROWS, got {text!r}")
+    if not (2 <= cols <= BOARD_MAX and 2 <= rows <= BOARD_MAX):
+        raise argparse.ArgumentTypeError(f"board must be from 2x2 to {BOARD_MAX}x{BOARD_MAX} cells")
+    return cols, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--policies", nargs="+", default=list(POLICIES), help=f"built-in ({', '.join(POLICIES)}) or module:function")
+    parser.add_argument("--games", type=int, default=200, help="per policy and speed")
+    parser.add_argument("--speeds", type=int, nargs="+", default=list(SPEEDS))
+    parser.add_argument("--board", type=board_size, default=(COLS, ROWS), metavar="COLSxROWS")
+    parser.add_argument("--banana-seconds", type=int, default=BANANA_SECONDS, help="lifetime of a banana")
+    parser.add_argument("--max-moves", type=int, default=100_000, help="stop games that last longer")
+    parser.add_argument("--seed", type=int, default=0, help="of the first game, the others follow")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=25, help="games sent to a worker at once")
+    parser.add_argument("--json", help="save the report to this file")
+    parser.add_argument("--csv", help="save the report as a table to this file")
+    args = parser.parse_args()
+    args.cols, args.rows = args.board
+    for name in args.policies:
+        try:
+            resolve(name)  # fail early, before starting workers
+        except (ValueError, ImportError, AttributeError) as err:
+            parser.error(str(err))
+
+    results = {name: {speed: [] for speed in args.speeds} for name in args.policies}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as executor:
+        for name, speed, games in executor.map(play_chunk, chunks(args)):
+            results[name][speed].extend(games)
+    elapsed = time.perf_counter() - start
+    report = aggregate(results)
+
+    width = max(6, *map(len, report))
+    print(f"{'policy':<{width}} {'speed':>5} {'games':>6} {'score mean':>10} {'p50':>5} {'p90':>5} {'max':>5} {'time p50 s':>10} {'time max s':>10}  most common end")
+    for name, policy_report in report.items():
+        for speed, stats in policy_report["speeds"].items():
+            score, seconds = stats["score"], stats["time"]
+            cause, count = next(iter(stats["causes"].items()))
+            print(f"{name:<{width}} {speed:>5} {stats['games']:>6} {score['mean']:>10.2f} {score['p50']:>5} {score['p90']:>5} {score['max']:>5} "
+                  f"{seconds['p50']:>10.1f} {seconds['max']:>10.1f}  {cause} ({count / stats['games']:.0%})")
+    games = len(args.policies) * len(args.speeds) * args.games
+    print(f"\n{games} games in {elapsed:.1f} s on {args.workers} worker(s), {games / elapsed:.0f} games/s")
+
+    settings = {"board": f"{args.cols}x{args.rows}", "banana_seconds": args.banana_seconds, "max_moves": args.max_moves, "seed": args.seed, "games": args.games}
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"settings": settings, "policies": report}, file, indent=2)
+    if args.csv:
+        with open(args.csv, "w", newline="") as file:
+            csv.writer(file).writerows(csv_rows(report))